@@ -15,5 +15,3 @@ try:
     from ._version import version_tuple
 except ImportError:
     version_tuple = (0, 0, "unknown version")
-
-print("in a301_lib init")
@@ -8,5 +8,3 @@ try:
     from ._version import version_tuple
 except ImportError:
     version_tuple = (0, 0, "unknown version")
-
-print("in rad_lib init")
@@ -14,4 +14,22 @@ try:
 except ImportError:
     version_tuple = (0, 0, "unknown version")
 
-print("in sat_lib init")
+#
+# submodules are imported on first attribute access (sat_lib.cloudsat,
+# sat_lib.mapping ...) so that "import sat_lib" and the command line
+# tools don't pay for xarray, pyproj, cartopy or pyresample until needed
+#
+_submodules = ["cache", "cloudsat", "cloudsat_batch", "geo_interp", "hdf4_catalog",
+               "hdf4_inspect", "landsat_read", "mapping", "meta_index", "modischan_read",
+               "modismeta_read", "mosaic", "parallel", "thermo", "timing"]
+
+
+def __getattr__(name):
+    if name in _submodules:
+        import importlib
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + _submodules)
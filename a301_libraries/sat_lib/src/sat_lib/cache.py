@@ -0,0 +1,30 @@
+"""
+  cache locations
+  _______________
+
+  every on-disk cache in sat_lib (decoded cloudsat granules, resampling
+  plans, named grids) lives under one root: $SAT_LIB_CACHE if it is set,
+  otherwise ~/.cache/sat_lib
+"""
+import os
+from pathlib import Path
+
+
+def cache_root(*parts):
+    """
+    return $SAT_LIB_CACHE (or ~/.cache/sat_lib) joined with parts
+
+    Parameters
+    ----------
+
+    parts: str
+       path components below the root, e.g. "resample" or "grids.json"
+
+    Returns
+    -------
+
+    the_path: Path object
+       not created; callers mkdir directories they write to
+    """
+    root = os.environ.get("SAT_LIB_CACHE", Path.home() / ".cache" / "sat_lib")
+    return Path(root).joinpath(*parts)
@@ -1,15 +1,22 @@
+from .cache import cache_root
+from .hdf4_catalog import read_swath_attributes, variable_catalog
 from .modischan_read import sd_open_file
+from .timing import timed
+import hashlib
+import inspect
+import logging
+import os
 import numpy as np
+import xarray
 from xarray import DataArray,Dataset
-import pyproj
 from pathlib import Path
-import datetime
 import dateutil.tz as tz
 from pyhdf.HDF import *
 from pyhdf.V   import *
 from pyhdf.VS  import *
 from pyhdf.SD  import *
-import pandas as pd
+
+logger = logging.getLogger(__name__)
 
 def add_storm_distance(the_ds):
     """Add a new coordinate called "storm_distance" to the dataset the_ds that is the distance in
@@ -32,291 +39,657 @@ def add_storm_distance(the_ds):
     return the_ds 
 
 
-def read_attrs(filename):
+def along_track_distance(lons, lats, method="geodesic"):
     """
-    Extract the data for non scientific data in V mode of hdf file
-    """
-    filename = Path(filename)
-    filename = str(filename)
-    hdf = HDF(filename, HC.READ)
-
-    # Initialize the SD, V and VS interfaces on the file.
-    sd = SD(filename)
-    vs = hdf.vstart()
-    v  = hdf.vgstart()
-    ref = -1
-    ref = v.getid(ref)
-    vg = v.attach(ref)
-    file_type = vg._name
-    attr_dict = read_swath_attributes(v,vs)
-    attr_dict['file_type']=file_type
-    #print(f"{attr_dict=}")
-    # Encontrar el puto id de las Geolocation Fields
-    # Terminate V, VS and SD interfaces.
-    v.end()
-    vs.end()
-    sd.end()
-    # Close HDF file.
-    hdf.close()
-    return attr_dict
+    cumulative distance in meters along a satellite ground track, starting
+    at 0 for the first profile
 
+    Parameters
+    ----------
 
-def read_swath_attributes(v,vs):
-    ref = v.find('Swath Attributes')
-    vg = v.attach(ref)
-    members = vg.tagrefs()
-    attr_dict = {}
-    for tag, ref in members:
-        if tag == HC.DFTAG_VH:
-            vd = vs.attach(ref)
-            nrecs, intmode, fields, size, name = vd.inquire()
-            value = vd.read()
-            attr_dict[name] = value
-            vd.detach()
-    vg.detach()
-    return attr_dict
+    lons: ndarray
+       profile longitudes in degrees east (1-D vector)
+    lats: ndarray
+       profile latitudes in degrees north (1-D vector)
+    method: str
+       "geodesic" (default) does a single batched pyproj.Geod.inv call on the
+       WGS84 ellipsoid, "haversine" uses a vectorized great circle on a sphere
+       of radius 6371 km, which is faster but differs by ~0.3%
 
-def get_geo(hdfname):
+    Returns
+    -------
+
+    distance: ndarray
+       cumulative distance in meters (1-D vector, same length as lons)
     """
-    given the name of any hdf file from the Cloudsat data archive
-    return lat,lon,time_vals,prof_times,dem_elevation
-    for the cloudsat orbital swath
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    if method == "geodesic":
+        import pyproj
+        great_circle = pyproj.Geod(ellps='WGS84')
+        azi12, azi21, step = great_circle.inv(lons[:-1], lats[:-1],
+                                              lons[1:], lats[1:])
+    elif method == "haversine":
+        earth_radius = 6371.e3
+        lon_rad, lat_rad = np.radians(lons), np.radians(lats)
+        dlon = np.diff(lon_rad)
+        dlat = np.diff(lat_rad)
+        hav = np.sin(dlat/2.)**2 + \
+            np.cos(lat_rad[:-1])*np.cos(lat_rad[1:])*np.sin(dlon/2.)**2
+        step = 2.*earth_radius*np.arcsin(np.sqrt(hav))
+    else:
+        raise ValueError(f"unknown distance method {method=}, "
+                         "expecting 'geodesic' or 'haversine'")
+    distance = np.empty_like(lons)
+    distance[0] = 0.
+    np.cumsum(step, out=distance[1:])
+    return distance
+
+def tai_to_datetime64(tai_start, profile_time):
+    """
+    convert cloudsat profile times to UTC datetime64 values in one numpy
+    operation
 
     Parameters
     ----------
-    
-    hdfname:  str or Path object
-       full path to the hdf4 file  http://www.cloudsat.cira.colostate.edu/dataSpecs.php
+
+    tai_start: float
+       seconds since Jan 1, 1993 that the orbit began (the TAI_start Vdata)
+    profile_time: ndarray
+       profile times in seconds since the beginning of the orbit (1-D vector)
 
     Returns
     -------
 
-    the_data: xarray Datset with the following DataArrays
+    time_vals: ndarray
+       profile times as datetime64[ns] (1-D vector)
 
-       lat  -- profile latitude in degrees east  (1-D vector)
-       lon  -- profile longitude in degrees north (1-D vector)
-       time_vals -- profile times in UTC  (1D vector)
-       prof_times -- profile times in seconds since beginning of orbit (1D vector)
-       dem_elevation -- surface elevation in meters
+    Notes
+    -----
+
+    both offsets are rounded to the nearest microsecond (half to even), which
+    is what datetime.timedelta does, so the values match the old
+    per-profile datetime loop exactly
     """
-    
-    hdfname = Path(hdfname).resolve()
-    hdfname=str(hdfname)
-    the_attrs = read_attrs(hdfname)
-    granule_id = int(the_attrs['granule_number'][0][0])
-    file_type = the_attrs['file_type']
-    hdffile=HDF(hdfname,HC.READ)
-    vs = hdffile.vstart()
-    out=vs.vdatainfo()
-    #uncomment this line to see the variable names
-    # print("VS variable names: ",out)
-    old_variable_names=['Longitude','Latitude','Profile_time']
-    new_variable_names=['longitude','latitude','profile_time']
-    var_dict={}
-    #
-    # save the variables and conver names to lower case
-    #
-    swath_attrs = read_attrs(hdfname)
-    for old_var_name,new_var_name in zip(old_variable_names,new_variable_names):
-        the_var=vs.attach(old_var_name)
-        nrecs=the_var._nrecs
-        the_data=the_var.read(nRec=nrecs)
-        the_data=np.array(the_data).squeeze()
-        var_dict[new_var_name]=the_data
-        the_var.detach()
-    if file_type == 'ECMWF-AUX':
-        the_var = vs.attach('EC_height')
-        nrecs=the_var._nrecs
-        the_data=the_var.read(nRec=nrecs)
-        the_data=np.array(the_data).squeeze()
-        var_dict['ec_height']=the_data
-        the_var.detach()
-    else: 
-        the_var = vs.attach('DEM_elevation')
-        nrecs=the_var._nrecs
-        the_data=the_var.read(nRec=nrecs)
-        the_data=np.array(the_data).squeeze()
-        var_dict['dem_elevation']=the_data
-        the_var.detach()
-    tai_start=vs.attach('TAI_start')
-    nrecs=tai_start._nrecs
-    tai_start_value=tai_start.read(nRec=nrecs)
-    tai_start.detach()
-    hdffile.close()
-    #
-    #tai_start is the number of seconds since Jan 1, 1993 that the orbit
-    # began
-    #
-    taiDelta=datetime.timedelta(seconds=tai_start_value[0][0])
-    taiDayOne=datetime.datetime(1993,1,1,tzinfo=tz.tzutc())
-    #this is the start time of the orbit in seconds since Jan 1, 1993
-    orbitStart=taiDayOne + taiDelta
-    time_vals=[]
-    #now loop throught he radar profile times and convert them to 
-    #python datetime objects in utc
-    for the_time in var_dict['profile_time']:
-        time_vals.append(orbitStart + datetime.timedelta(seconds=float(the_time)))
-    time_vals = np.array(time_vals)
-    day = time_vals[0].strftime("%Y-%m-%d")
-    orbit_start_time = time_vals[0].isoformat()
-    orbit_end_time = time_vals[-1].isoformat()
-    time_vals = time_vals.astype("datetime64[ns]")
-    var_dict['time_vals']=time_vals
-    #
-    # great circle distance
-    #
-    great_circle=pyproj.Geod(ellps='WGS84')
-    distance=[0]
-    lons, lats = var_dict['longitude'], var_dict['latitude']
-    start=(lons[0],lats[0])
-    meters2km = 1.e-3
-    for index in np.arange(1,len(var_dict['longitude'])):
-        azi12,azi21,step= \
-            great_circle.inv(lons[index-1],lats[index-1],lons[index],lats[index])   
-        distance.append(distance[index-1] + step)
-    distance_km=np.array(distance)*meters2km
-    var_dict['distance_km']=distance_km
-    coord_names=['profile_time','distance_km','time_vals']
-    variable_names=['latitude','longitude']
-    variable_dict = {key:(['time'],var_dict[key]) for key in variable_names}
-    coord_dict = {key:var_dict[key] for key in coord_names}
-    #
-    # get the height array if it exists
-    #
-    if file_type != 'ECMWF-AUX':
-        hdf_SD = sd_open_file(hdfname)
-        var_sd=hdf_SD.select('Height')
+    tai_day_one = np.datetime64('1993-01-01T00:00:00', 'us')
+    tai_delta = np.timedelta64(int(np.round(float(tai_start)*1.e6)), 'us')
+    orbit_start = tai_day_one + tai_delta
+    profile_time = np.asarray(profile_time, dtype=np.float64)
+    profile_delta = np.round(profile_time*1.e6).astype(np.int64).astype('timedelta64[us]')
+    time_vals = (orbit_start + profile_delta).astype("datetime64[ns]")
+    return time_vals
+
+class LazySDS:
+    """
+    array-like stand-in for a cloudsat SDS that reads only the requested
+    hyperslab with SDS.get(start, count, stride).  Wrapped by
+    dask.array.from_array in CloudsatFile when lazy=True, so slicing the
+    resulting DataArray by time only reads those profiles from disk
+
+    Parameters
+    ----------
+
+    filename: str
+       path to the cloudsat hdf file
+    varname: str
+       name of the SDS
+    shape: tuple
+       SDS dimensions
+    dtype: numpy dtype
+       SDS type
+    """
+    def __init__(self, filename, varname, shape, dtype):
+        self.filename = filename
+        self.varname = varname
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.ndim = len(self.shape)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if Ellipsis in key:
+            index = key.index(Ellipsis)
+            fill = (slice(None),)*(self.ndim - len(key) + 1)
+            key = key[:index] + fill + key[index + 1:]
+        key = key + (slice(None),)*(self.ndim - len(key))
+        start, count, stride = [], [], []
+        #
+        # anything that isn't a positive step slice or an integer
+        # is read for the whole axis and applied afterwards
+        #
+        post_key = []
+        for the_key, length in zip(key, self.shape):
+            if isinstance(the_key, (int, np.integer)):
+                the_key = int(the_key) % length
+                start.append(the_key)
+                count.append(1)
+                stride.append(1)
+                post_key.append(0)
+            elif isinstance(the_key, slice) and (the_key.step is None or the_key.step > 0):
+                first, stop, step = the_key.indices(length)
+                start.append(first)
+                count.append(len(range(first, stop, step)))
+                stride.append(step)
+                post_key.append(slice(None))
+            else:
+                start.append(0)
+                count.append(length)
+                stride.append(1)
+                post_key.append(the_key)
+        if 0 in count:
+            var_vals = np.empty(count, dtype=self.dtype)
+        else:
+            with timed("open"):
+                sd = sd_open_file(self.filename)
+            with timed("sds read") as record:
+                var_sd = sd.select(self.varname)
+                var_vals = var_sd.get(start=start, count=count, stride=stride)
+                var_sd.endaccess()
+                var_vals = np.asarray(var_vals).reshape(count)
+                record["nbytes"] = var_vals.nbytes
+            sd.end()
+        return var_vals[tuple(post_key)]
+
+
+class CloudsatFile:
+    """
+    an open cloudsat hdf4 granule.  The HDF, SD, V and VS interfaces are
+    started once, and the swath attributes and the Data Fields variable
+    index are cached, so geolocation and any number of variables can be
+    read without reopening the file
+
+    use as a context manager::
+
+        with CloudsatFile(filename) as cs:
+            geo_ds = cs.get_geo()
+            radar_ds = cs.read_cloudsat_var('Radar_Reflectivity')
+
+    Parameters
+    ----------
+
+    filename: str or Path object
+       path to the cloudsat hdf file
+
+    lazy: bool
+       if True, 2-D SDS variables (and full_heights) are returned as
+       dask arrays chunked along time, and only the profiles that are
+       actually used are read from the file when they are computed
+
+    chunk_profiles: int
+       number of profiles per dask chunk when lazy is True
+
+    time_range: tuple or None
+       (start, stop) times as strings or datetime64 values, inclusive.
+       If given, only the profiles between the first and last profile
+       in this range are read from every Vdata and SDS
+
+    bbox: tuple or None
+       (west, south, east, north) bounding box in degrees.  Profiles are
+       selected like time_range, and both are applied if both are given.
+       If west > east the box crosses the antimeridian
+
+    full_heights: bool or "lazy"
+       True adds the 2-D Height field as the full_heights coordinate,
+       False leaves it out (the 1-D height axis is always there), and
+       "lazy" adds it as a dask array that is only read when used
+    """
+    def __init__(self, filename, lazy=False, chunk_profiles=1000,
+                 time_range=None, bbox=None, full_heights=True):
+        self.filename = str(Path(filename).resolve())
+        self.lazy = lazy
+        self.chunk_profiles = chunk_profiles
+        self.time_range = time_range
+        self.bbox = bbox
+        self.full_heights = full_heights
+        self._nprofiles = None
+        self._profile_slice = None
+        with timed("open"):
+            self.sd = sd_open_file(self.filename)
+            #
+            # __exit__ won't run if the constructor fails, so close
+            # whatever is already open before re-raising
+            #
+            self.hdf = None
+            try:
+                self.hdf = HDF(self.filename, HC.READ)
+                self.vs = self.hdf.vstart()
+                self.v = self.hdf.vgstart()
+            except Exception:
+                if self.hdf is not None:
+                    self.hdf.close()
+                self.sd.end()
+                raise
+        self._swath_attrs = None
+        self._var_index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        terminate the V, VS and SD interfaces and close the file
+        """
+        if self.hdf is None:
+            return
+        self.v.end()
+        self.vs.end()
+        self.sd.end()
+        self.hdf.close()
+        self.hdf = None
+
+    @property
+    def swath_attrs(self):
+        """
+        dictionary with the Swath Attributes Vdata values plus the
+        file_type (name of the first vgroup)
+        """
+        if self._swath_attrs is None:
+            with timed("attribute read"):
+                ref = self.v.getid(-1)
+                vg = self.v.attach(ref)
+                file_type = vg._name
+                vg.detach()
+                attr_dict = read_swath_attributes(self.v, self.vs)
+                attr_dict['file_type'] = file_type
+            self._swath_attrs = attr_dict
+        return self._swath_attrs
+
+    @property
+    def var_index(self):
+        """
+        dictionary indexed by variable name with the ref and shape
+        information for every Vdata and SDS in the Data Fields vgroup,
+        shared through the per-file cache in sat_lib.hdf4_catalog
+        """
+        if self._var_index is None:
+            self._var_index = variable_catalog(self.filename, self.sd, self.v, self.vs,
+                                               swath_attrs=self.swath_attrs)
+        return self._var_index
+
+    @property
+    def nprofiles(self):
+        """
+        number of radar profiles in the granule (length of the time
+        dimension before any subsetting)
+        """
+        if self._nprofiles is None:
+            the_var = self.vs.attach('Profile_time')
+            self._nprofiles = the_var._nrecs
+            the_var.detach()
+        return self._nprofiles
+
+    @property
+    def profile_slice(self):
+        """
+        slice of profile indices selected by time_range and bbox, found
+        from the Vdata geolocation before any SDS is read
+        """
+        if self._profile_slice is None:
+            nprofiles = self.nprofiles
+            if self.time_range is None and self.bbox is None:
+                self._profile_slice = slice(0, nprofiles)
+                return self._profile_slice
+            keep = np.ones(nprofiles, dtype=bool)
+            if self.time_range is not None:
+                time_vals = tai_to_datetime64(self.read_vdata('TAI_start'),
+                                              self.read_vdata('Profile_time'))
+                start = np.datetime64(self.time_range[0], 'ns')
+                stop = np.datetime64(self.time_range[1], 'ns')
+                keep &= np.logical_and(time_vals >= start, time_vals <= stop)
+            if self.bbox is not None:
+                west, south, east, north = self.bbox
+                lons = self.read_vdata('Longitude')
+                lats = self.read_vdata('Latitude')
+                if west <= east:
+                    lon_hit = np.logical_and(lons >= west, lons <= east)
+                else:
+                    lon_hit = np.logical_or(lons >= west, lons <= east)
+                keep &= lon_hit & np.logical_and(lats >= south, lats <= north)
+            hit = np.flatnonzero(keep)
+            if len(hit) == 0:
+                raise ValueError(f"no profiles in {self.time_range=} {self.bbox=} "
+                                 f"for {self.filename}")
+            self._profile_slice = slice(int(hit[0]), int(hit[-1]) + 1)
+        return self._profile_slice
+
+    def _time_window(self, dims):
+        """
+        start and count lists for SDS.get that select profile_slice
+        along the time axis and everything along the other axes
+        """
+        the_slice = self.profile_slice
+        start, count = [], []
+        for length in dims:
+            if length == self.nprofiles:
+                start.append(the_slice.start)
+                count.append(the_slice.stop - the_slice.start)
+            else:
+                start.append(0)
+                count.append(length)
+        return start, count
+
+    def reference_height(self):
+        """
+        find the first profile in the orbit with a valid Height at level
+        100 and return that profile's heights as the height axis.  The
+        search always covers the whole orbit, not just profile_slice, so
+        a time_range or bbox read gets the same height coordinate as a
+        full read.  Only level 100 and the chosen profile are read from
+        the Height SDS
+
+        Returns
+        -------
+
+        the_time, height: int, ndarray
+           orbit index of the reference profile and its float32 heights
+           with missing values set to np.nan
+        """
+        missing_value = np.array(self.swath_attrs['Height.missing']).squeeze()
+        var_sd = self.sd.select('Height')
+        name, rank, dims, the_type, nattrs = var_sd.info()
+        level_100 = var_sd.get(start=[0, 100], count=[dims[0], 1])
+        valid_100 = np.asarray(level_100).reshape(-1) != missing_value
+        if not valid_100.any():
+            var_sd.endaccess()
+            raise ValueError(f"no heights available in {self.filename=}")
+        the_time = int(np.argmax(valid_100))
+        with timed("sds read") as record:
+            height = var_sd.get(start=[the_time, 0], count=[1, dims[1]])
+            record["nbytes"] = np.asarray(height).nbytes + np.asarray(level_100).nbytes
+        var_sd.endaccess()
+        height = _mask_and_scale(np.asarray(height).reshape(-1), missing_value, None)
+        return the_time, height
+
+    def read_sds(self, varname):
+        """
+        read the profile_slice hyperslab of the SDS varname
+
+        Returns
+        -------
+
+        var_vals, var_attrs: ndarray, dict
+           raw values and SDS attributes
+        """
+        var_sd = self.sd.select(varname)
+        name, rank, dims, the_type, nattrs = var_sd.info()
+        if rank == 1:
+            dims = [dims]
+        start, count = self._time_window(dims)
+        with timed("sds read") as record:
+            var_vals = var_sd.get(start=start, count=count)
+            var_vals = np.asarray(var_vals).reshape(count)
+            record["nbytes"] = var_vals.nbytes
         var_attrs = var_sd.attributes()
-        var_vals=var_sd.get()
-        missing_value = swath_attrs['Height.missing']
-        missing_vals = (var_vals == missing_value)
-        var_vals =var_vals.astype(np.float32)
-        var_vals[missing_vals]=np.nan
-        height_array =var_vals
-        height = height_array[0,:]
-        var_dict['full_heights'] = (['time','height'],height_array)
+        var_sd.endaccess()
+        return var_vals, var_attrs
+
+    def lazy_sds(self, varname):
+        """
+        return the SDS varname as a dask array chunked along the
+        time dimension, without reading any data values
+        """
+        import dask.array as da
+        var_sd = self.sd.select(varname)
+        name, rank, dims, the_type, nattrs = var_sd.info()
+        if rank == 1:
+            dims = [dims]
+        sample = var_sd.get(start=[0]*rank, count=[1]*rank)
+        var_sd.endaccess()
+        nprofiles = self.nprofiles
+        chunks = tuple(self.chunk_profiles if length == nprofiles else -1
+                       for length in dims)
+        lazy_var = LazySDS(self.filename, varname, dims, np.asarray(sample).dtype)
+        var_vals = da.from_array(lazy_var, chunks=chunks, lock=True)
+        key = tuple(self.profile_slice if length == nprofiles else slice(None)
+                    for length in dims)
+        return var_vals[key]
+
+    def read_vdata(self, name):
+        """
+        read all records of the Vdata called name (or with ref name)
+        and return them as a squeezed ndarray
+        """
+        with timed("vdata read") as record:
+            the_var = self.vs.attach(name)
+            nrecs = the_var._nrecs
+            the_data = the_var.read(nRec=nrecs)
+            the_var.detach()
+            the_data = np.array(the_data).squeeze()
+            record["nbytes"] = the_data.nbytes
+        return the_data
+
+    def read_profile_vdata(self, name):
+        """
+        read the Vdata name, keeping only profile_slice if it has one
+        record per profile
+        """
+        var_vals = self.read_vdata(name)
+        if var_vals.ndim > 0 and len(var_vals) == self.nprofiles:
+            var_vals = var_vals[self.profile_slice]
+        return var_vals
+
+    def read_var(self, varname):
+        """
+        read the unscaled values of a Data Fields variable
+
+        Parameters
+        ----------
+
+        varname: str
+           name of the Vdata or SDS
+
+        Returns
+        -------
+
+        var_vals, var_attrs: ndarray, dict
+           raw values (a dask array for an SDS if lazy is True), and the
+           SDS attributes (None for a Vdata)
+        """
+        var_index = self.var_index
+        if varname not in var_index:
+            raise KeyError(f"can't fine {varname} in {self.filename}")
+        logger.debug("reading %s from %s", varname, self.filename)
+        if 'rank' in var_index[varname] and self.lazy:
+            var_vals = self.lazy_sds(varname)
+            var_sd = self.sd.select(varname)
+            var_attrs = var_sd.attributes()
+            var_sd.endaccess()
+        elif 'rank' in var_index[varname]:
+            var_vals, var_attrs = self.read_sds(varname)
+        else:
+            var_vals = self.read_profile_vdata(var_index[varname]['ref'])
+            var_attrs = None
+        return var_vals, var_attrs
+
+    def get_geo(self, distance_method="geodesic"):
+        """
+        return the geolocation dataset for the granule, see
+        sat_lib.cloudsat.get_geo
+        """
+        the_attrs = self.swath_attrs
+        granule_id = int(the_attrs['granule_number'][0][0])
+        file_type = the_attrs['file_type']
+        old_variable_names=['Longitude','Latitude','Profile_time']
+        new_variable_names=['longitude','latitude','profile_time']
+        var_dict={}
         #
-        # y axis is first non-nan height column
+        # save the variables and conver names to lower case
         #
-        ntimes, nrows = height_array.shape
+        for old_var_name,new_var_name in zip(old_variable_names,new_variable_names):
+            var_dict[new_var_name]=self.read_vdata(old_var_name)
+        if file_type == 'ECMWF-AUX':
+            var_dict['ec_height']=self.read_vdata('EC_height')
+        else:
+            var_dict['dem_elevation']=self.read_vdata('DEM_elevation')
+        tai_start_value=self.read_vdata('TAI_start')
         #
-        # find a height at level 100 that's not nan
+        #tai_start is the number of seconds since Jan 1, 1993 that the orbit
+        # began
         #
-        no_time = True
-        for the_time in range(ntimes):
-            if not np.isnan(height_array[the_time,100]):
-                no_time = False
-                break
-        if no_time:
-            raise ValueError(f"no heights available in {hdfname=}")
-        print(f"using timestep {the_time} to set heights")
-        coord_dict['height'] = height_array[the_time,:]
-        coord_dict['full_heights'] = height_array[:,:]
-        variable_dict['dem_elevation'] = (['time'], var_dict['dem_elevation'])
-        hdf_SD.end()
-    else:
+        time_vals = tai_to_datetime64(tai_start_value, var_dict['profile_time'])
+        orbit_start = time_vals[0].astype("datetime64[us]").item().replace(tzinfo=tz.tzutc())
+        orbit_end = time_vals[-1].astype("datetime64[us]").item().replace(tzinfo=tz.tzutc())
+        day = orbit_start.strftime("%Y-%m-%d")
+        orbit_start_time = orbit_start.isoformat()
+        orbit_end_time = orbit_end.isoformat()
+        var_dict['time_vals']=time_vals
         #
-        # model only has vector height
+        # great circle distance
         #
-        coord_dict['height'] = var_dict['ec_height']
-    coord_dict['height_km']= coord_dict['height']*meters2km
-    # print(f"making new height_km, {coord_dict['height_km'][:5]=}")
-    #
-    # write the dataset
-    # 
-    attrs = dict(file_type=file_type,orbit_start_time = orbit_start_time,
-                 orbit_end_time = orbit_end_time, granule_id=granule_id,
-                 day = day)
-    coords={'time':(['time'],coord_dict['time_vals']),
-            'height':(['height'],coord_dict['height']),
-            'height_km':(['height'],coord_dict['height_km']),
-            'distance_km':(['time'],coord_dict['distance_km']),
-            'profile_time':(['time'],coord_dict['profile_time'])
-            }
-    if attrs['file_type'] != "ECMWF-AUX":
-        coords["full_heights"]=(['time','height'],coord_dict['full_heights'])
-
-    # print(f"making distance_km: {coords['distance_km'][1][:5]=}")
-    the_data = Dataset(data_vars=variable_dict, coords=coords,attrs=attrs)
-    return the_data
-
-def read_var(varname, hdfname):
-    hdfname = Path(hdfname).resolve()
-    hdfname=str(hdfname)
-    sd = sd_open_file(hdfname)
-    hdf = HDF(hdfname, HC.READ)
-    vs = hdf.vstart()
-    v  = hdf.vgstart()
-    ref = v.find('Data Fields')
-    vg = v.attach(ref)
-    members = vg.tagrefs()
-    var_dict = dict()
-    #
-    # build a dictionary with all variable names
-    #
-    for tag, ref in members:
-        # Vdata tag
-        if tag == HC.DFTAG_VH:
-            vd = vs.attach(ref)
-            nrecs, intmode, fields, size, name = vd.inquire()
-            # nrecs, intmode, fields, size, name = vd.inquire()
-            # nrecs.append(vd.inquire()[0]) # number of records of the Vdata
-            # names.append(vd.inquire()[-1])# name of the Vdata
-            vd.detach()
-            row_dict = dict(ref=ref,nrecs=nrecs,intmod=intmode,fields=fields,size=size)
-            var_dict[name] = row_dict
-        elif tag == HC.DFTAG_NDG:
-            sds = sd.select(sd.reftoindex(ref))
-            name, rank, dims, the_type, nattrs = sds.info()
-            row_dict = dict(ref=ref,rank=rank,dims=dims,the_type=the_type,nattrs=nattrs)
-            var_dict[name] = row_dict
-            sds.endaccess()
-    if varname not in var_dict:
-        raise KeyError(f"can't fine {varname} in {hdfname}")
-    else:
-        print(f"in read_cloudsat_var: reading {varname=}")
-        if 'rank' in var_dict[varname]:
-            var_sd=sd.select(varname)
-            var_vals=var_sd.get()
-            var_attrs = var_sd.attributes()
-            #print(f"found sds {varname=}: {var_attrs=}")
-            #print(f"sd variable type before scaling: {var_vals.dtype=}")
+        lons, lats = var_dict['longitude'], var_dict['latitude']
+        meters2km = 1.e-3
+        with timed("geodesic"):
+            distance_km = along_track_distance(lons, lats, method=distance_method)*meters2km
+        var_dict['distance_km']=distance_km
+        #
+        # times and distances are from the start of the orbit, so
+        # compute them for every profile and then keep the subset
+        #
+        the_slice = self.profile_slice
+        profile_vars = ['longitude','latitude','profile_time','time_vals','distance_km']
+        if file_type != 'ECMWF-AUX':
+            profile_vars.append('dem_elevation')
+        for key in profile_vars:
+            var_dict[key] = var_dict[key][the_slice]
+        coord_names=['profile_time','distance_km','time_vals']
+        variable_names=['latitude','longitude']
+        variable_dict = {key:(['time'],var_dict[key]) for key in variable_names}
+        coord_dict = {key:var_dict[key] for key in coord_names}
+        #
+        # get the height array if it exists
+        #
+        if file_type != 'ECMWF-AUX':
+            the_time, coord_dict['height'] = self.reference_height()
+            logger.debug("using timestep %d to set heights", the_time)
+            missing_value = np.array(the_attrs['Height.missing']).squeeze()
+            if self.full_heights == "lazy" or (self.full_heights and self.lazy):
+                coord_dict['full_heights'] = _blockwise(_mask_and_scale, self.lazy_sds('Height'),
+                                                        missing_value, None)
+            elif self.full_heights:
+                var_vals, var_attrs = self.read_sds('Height')
+                coord_dict['full_heights'] = _mask_and_scale(var_vals, missing_value, None)
+            variable_dict['dem_elevation'] = (['time'], var_dict['dem_elevation'])
         else:
-            nrecs = var_dict[varname]['nrecs']
-            ref = var_dict[varname]['ref']
-            var = vs.attach(ref)
-            var_vals   = var.read(nrecs)
-            var_vals=np.array(var_vals).squeeze()
-            var_attrs = None
-            #print(f"found Vdata {varname=}\n{var_vals=}\n{var_attrs=}")
-            #print(f"vdata variable type before scaling: {var_vals.dtype=}")
-            var.detach()
-    v.end()
-    vs.end()
-    hdf.close()
-    return var_vals, var_attrs
+            #
+            # model only has vector height
+            #
+            coord_dict['height'] = var_dict['ec_height']
+        coord_dict['height_km']= coord_dict['height']*meters2km
+        #
+        # write the dataset
+        #
+        attrs = dict(file_type=file_type,orbit_start_time = orbit_start_time,
+                     orbit_end_time = orbit_end_time, granule_id=granule_id,
+                     day = day)
+        coords={'time':(['time'],coord_dict['time_vals']),
+                'height':(['height'],coord_dict['height']),
+                'height_km':(['height'],coord_dict['height_km']),
+                'distance_km':(['time'],coord_dict['distance_km']),
+                'profile_time':(['time'],coord_dict['profile_time'])
+                }
+        if 'full_heights' in coord_dict:
+            coords["full_heights"]=(['time','height'],coord_dict['full_heights'])
+        with timed("dataset build"):
+            the_data = Dataset(data_vars=variable_dict, coords=coords,attrs=attrs)
+        return the_data
 
-def read_cloudsat_var(varname, filename):
+    def read_cloudsat_var(self, varname, distance_method="geodesic"):
+        """
+        return the geolocation dataset with varname added, see
+        sat_lib.cloudsat.read_cloudsat_var
+        """
+        return self.read_cloudsat_vars([varname], distance_method=distance_method)
+
+    def read_cloudsat_vars(self, varnames, distance_method="geodesic"):
+        """
+        return the geolocation dataset with every variable in varnames
+        added, see sat_lib.cloudsat.read_cloudsat_vars
+        """
+        the_data = self.get_geo(distance_method=distance_method)
+        if "QR" in varnames:
+            the_data = the_data.expand_dims(dim = {'sw_lw':2})
+        for varname in varnames:
+            var_vals, var_attrs = self.read_var(varname)
+            with timed("scaling"):
+                var_array = scale_cloudsat_var(varname, var_vals, var_attrs, self.swath_attrs)
+            with timed("dataset build"):
+                the_data[varname] = var_array
+        return the_data
+
+
+def _blockwise(func, var_vals, *args):
     """
-    Given a variable name and a file name, return a cloudsat dataset
+    apply func to a numpy array directly, or chunk by chunk to a dask array
+    """
+    if isinstance(var_vals, np.ndarray):
+        return func(var_vals, *args)
+    return var_vals.map_blocks(func, *args)
+
+
+def _mask_and_scale(var_vals, missing_value, factor):
+    """
+    replace missing_value with np.nan (converting to float32) and divide by
+    factor, skipping either step if it is None.  Float input is modified
+    in place
+    """
+    if missing_value is not None:
+        missing_vals = (var_vals == missing_value)
+        var_vals = var_vals.astype(np.float32, copy=False)
+        var_vals[missing_vals] = np.nan
+    if factor is not None and var_vals.dtype.kind == 'f':
+        var_vals /= factor
+    elif factor is not None:
+        var_vals = var_vals/factor
+    return var_vals
+
+
+def _mask_negative(var_vals):
+    """
+    return a copy of var_vals with negative values set to np.nan
+    """
+    var_vals = var_vals.copy()
+    var_vals[var_vals < 0] = np.nan
+    return var_vals
+
+
+def scale_cloudsat_var(varname, var_vals, var_attrs, swath_attrs):
+    """
+    replace the missing values in var_vals with np.nan, divide by the
+    swath attribute factor and return a labeled DataArray
 
     Parameters
     ----------
 
     varname: str
        name of cloudsat variable
+    var_vals: ndarray or dask array
+       unscaled values returned by read_var
+    var_attrs: dict or None
+       SDS attributes returned by read_var
+    swath_attrs: dict
+       swath attributes returned by read_attrs
 
-    filename: str or Path object
-       path to the cloudsat haf file
+    Returns
+    -------
+
+    var_array: xarray DataArray
+       scaled variable with dimensions time, (height) or sw_lw, time, height
     """
-    the_data = get_geo(filename)
-    swath_attrs = read_attrs(filename)
-    var_vals, var_attrs = read_var(varname, filename)
-    var_vals = var_vals.squeeze()
+    #
+    # drop singleton axes, but never the time axis (the second axis of
+    # QR), which has length 1 when time_range or bbox picks one profile
+    #
+    time_axis = 1 if varname == "QR" else 0
+    squeeze_axes = tuple(axis for axis, length in enumerate(var_vals.shape)
+                         if length == 1 and axis != time_axis)
+    var_vals = var_vals.squeeze(axis=squeeze_axes)
     #
     # mask on the integer missing_value
     #
-    print(f"{var_vals.shape=}")
     missing_name = f"{varname}.missing"
     if missing_name in swath_attrs:
         if varname in ["cloud_liquid_water","precip_liquid_water","precip_ice_water","QR"]:
@@ -332,36 +705,343 @@ def read_cloudsat_var(varname, filename):
                 missing_value = -9999
         elif varname in ['QR']:
             missing_value = -999
-            print(f"here: {var_vals=}")
         else:
             missing_value = np.array(swath_attrs[missing_name]).squeeze()
-        print(f"replacing {missing_value=} with np.nan")
-        missing_vals = (var_vals == missing_value).squeeze()
-        var_vals =var_vals.astype(np.float32)
-        var_vals[missing_vals]=np.nan
+        logger.debug("replacing %s missing value %s with np.nan", varname, missing_value)
+    else:
+        missing_value = None
     factor_name = f"{varname}.factor"
     if factor_name in swath_attrs:
         factor = np.array(swath_attrs[factor_name]).squeeze()
-        var_vals = var_vals/factor
+    else:
+        factor = None
+    var_vals = _blockwise(_mask_and_scale, var_vals, missing_value, factor)
     if var_vals.ndim == 2 and varname != "LayerTop":
         # https://www.cloudsat.cira.colostate.edu/data-products/2b-geoprof
         var_array = DataArray(var_vals,dims=['time','height'],attrs=var_attrs)
     elif varname == "QR":
-        the_data = the_data.expand_dims(dim = {'sw_lw':2}).squeeze()
         var_attrs['sw_lw'] = 'index 0 = shortwave, index 1 = longwave'
         var_array = DataArray(var_vals,dims=['sw_lw','time','height'],attrs=var_attrs)
     elif varname == 'LayerTop':
-        var_vals[var_vals < 0]=np.nan
         #
         # 5 nray values, take the first 1
         #
-        var_value = var_vals[:,0]
+        var_value = _blockwise(_mask_negative, var_vals[:,0])
         var_array = DataArray(var_value,dims=['time'],attrs=var_attrs)
     elif var_vals.ndim == 1:
          var_array = DataArray(var_vals,dims=['time'],attrs=var_attrs)
     else:
-        raise ValueError(f"problem reading {varname} from {filename}")
-    the_data[varname] = var_array
-    return the_data
-    
+        raise ValueError(f"problem reading {varname} from {swath_attrs['file_type']}")
+    return var_array
+
+
+def read_attrs(filename):
+    """
+    Extract the data for non scientific data in V mode of hdf file
+    """
+    with CloudsatFile(filename) as cs:
+        attr_dict = cs.swath_attrs
+    return attr_dict
+
+
+def get_geo(hdfname, distance_method="geodesic", lazy=False, chunk_profiles=1000,
+            time_range=None, bbox=None, full_heights=True):
+    """
+    given the name of any hdf file from the Cloudsat data archive
+    return lat,lon,time_vals,prof_times,dem_elevation
+    for the cloudsat orbital swath
+
+    Parameters
+    ----------
     
+    hdfname:  str or Path object
+       full path to the hdf4 file  http://www.cloudsat.cira.colostate.edu/dataSpecs.php
+
+    distance_method: str
+       "geodesic" or "haversine", passed to along_track_distance
+
+    lazy: bool
+       if True full_heights is a dask array read on demand, see CloudsatFile
+
+    chunk_profiles: int
+       number of profiles per dask chunk when lazy is True
+
+    time_range: tuple or None
+       (start, stop) times, read only the profiles in this range
+
+    bbox: tuple or None
+       (west, south, east, north) in degrees, read only the profiles
+       in this box
+
+    full_heights: bool or "lazy"
+       whether to add the 2-D full_heights coordinate, see CloudsatFile
+
+    Returns
+    -------
+
+    the_data: xarray Datset with the following DataArrays
+
+       lat  -- profile latitude in degrees east  (1-D vector)
+       lon  -- profile longitude in degrees north (1-D vector)
+       time_vals -- profile times in UTC  (1D vector)
+       prof_times -- profile times in seconds since beginning of orbit (1D vector)
+       dem_elevation -- surface elevation in meters
+    """
+    with CloudsatFile(hdfname, lazy=lazy, chunk_profiles=chunk_profiles,
+                      time_range=time_range, bbox=bbox,
+                      full_heights=full_heights) as cs:
+        the_data = cs.get_geo(distance_method=distance_method)
+    return the_data
+
+
+def read_var(varname, hdfname):
+    with CloudsatFile(hdfname) as cs:
+        var_vals, var_attrs = cs.read_var(varname)
+    return var_vals, var_attrs
+
+
+def read_cloudsat_var(varname, filename, lazy=False, chunk_profiles=1000,
+                      time_range=None, bbox=None, full_heights=True):
+    """
+    Given a variable name and a file name, return a cloudsat dataset
+
+    Parameters
+    ----------
+
+    varname: str
+       name of cloudsat variable
+
+    filename: str or Path object
+       path to the cloudsat haf file
+
+    lazy: bool
+       if True, 2-D variables are dask arrays and selecting a storm segment
+       with isel/sel before computing only reads those profiles
+
+    chunk_profiles: int
+       number of profiles per dask chunk when lazy is True
+
+    time_range: tuple or None
+       (start, stop) times, e.g. ('2008-02-14T18:55', '2008-02-14T18:58'),
+       read only the profiles in this range.  This replaces selecting
+       the storm segment with np.logical_and and isel after the read
+
+    bbox: tuple or None
+       (west, south, east, north) in degrees, read only the profiles
+       in this box
+
+    full_heights: bool or "lazy"
+       whether to add the 2-D full_heights coordinate, see CloudsatFile
+
+    Returns
+    -------
+
+    the_data: xarray Dataset
+       geolocation dataset from get_geo with varname added.  Variables
+       with a missing value (Radar_Reflectivity, QR ...) are float32 with
+       np.nan for missing data; older versions returned float64, so use
+       astype(np.float64) if you need the extra precision
+    """
+    with CloudsatFile(filename, lazy=lazy, chunk_profiles=chunk_profiles,
+                      time_range=time_range, bbox=bbox,
+                      full_heights=full_heights) as cs:
+        the_data = cs.read_cloudsat_var(varname)
+    return the_data
+
+
+def read_cloudsat_vars(varnames, filename, lazy=False, chunk_profiles=1000,
+                       time_range=None, bbox=None, full_heights=True):
+    """
+    Given a list of variable names and a file name, return a cloudsat
+    dataset holding all of them.  The file is opened and the geolocation
+    coordinates are computed once, no matter how many variables are read
+
+    Parameters
+    ----------
+
+    varnames: list of str
+       names of cloudsat variables, e.g. ['Radar_Reflectivity','QR']
+
+    filename: str or Path object
+       path to the cloudsat haf file
+
+    lazy: bool
+       if True, 2-D variables are dask arrays read on demand, see
+       read_cloudsat_var
+
+    chunk_profiles: int
+       number of profiles per dask chunk when lazy is True
+
+    time_range: tuple or None
+       (start, stop) times, read only the profiles in this range
+
+    bbox: tuple or None
+       (west, south, east, north) in degrees, read only the profiles
+       in this box
+
+    full_heights: bool or "lazy"
+       whether to add the 2-D full_heights coordinate, see CloudsatFile
+
+    Returns
+    -------
+
+    the_data: xarray Dataset
+       geolocation dataset from get_geo with one DataArray per variable,
+       float32 for variables with a missing value, see read_cloudsat_var
+    """
+    with CloudsatFile(filename, lazy=lazy, chunk_profiles=chunk_profiles,
+                      time_range=time_range, bbox=bbox,
+                      full_heights=full_heights) as cs:
+        the_data = cs.read_cloudsat_vars(varnames)
+    return the_data
+
+
+class CloudsatCache:
+    """
+    on-disk cache of decoded cloudsat datasets.  Each entry is a compressed,
+    chunked netcdf file keyed by the granule path, its modification time,
+    the variable list and the read options, so editing or replacing the
+    granule automatically misses the cache.  The least recently used
+    entries are deleted when the cache grows past max_bytes
+
+    usage::
+
+        cache = CloudsatCache()
+        radar_ds = cache.read_cloudsat_vars(['Radar_Reflectivity'], filename)
+
+    Parameters
+    ----------
+
+    cache_dir: str or Path object or None
+       cache directory, defaults to $SAT_LIB_CACHE/cloudsat or
+       ~/.cache/sat_lib/cloudsat
+
+    max_bytes: int
+       total size of the cache files before eviction starts
+
+    chunk_profiles: int
+       netcdf chunk length along the time dimension
+    """
+    def __init__(self, cache_dir=None, max_bytes=10_000_000_000, chunk_profiles=1000):
+        if cache_dir is None:
+            cache_dir = cache_root("cloudsat")
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.chunk_profiles = chunk_profiles
+
+    def cache_path(self, varnames, filename, **read_kwargs):
+        """
+        return the path of the cache entry for this granule, variable
+        list and read options
+        """
+        hdf_path = Path(filename).resolve()
+        mtime = hdf_path.stat().st_mtime_ns
+        #
+        # fill in the defaults, so full_heights=True and leaving it out
+        # give the same key
+        #
+        bound = inspect.signature(read_cloudsat_vars).bind_partial(**read_kwargs)
+        bound.apply_defaults()
+        read_kwargs = {key: value for key, value in bound.arguments.items()
+                       if key not in ("varnames", "filename", "lazy")}
+        key_items = [str(hdf_path), str(mtime), ",".join(sorted(varnames))]
+        key_items.extend(f"{key}={read_kwargs[key]}" for key in sorted(read_kwargs))
+        the_hash = hashlib.sha1("|".join(key_items).encode()).hexdigest()[:16]
+        return self.cache_dir / f"{self._granule_prefix(hdf_path)}-{the_hash}.nc"
+
+    @staticmethod
+    def _granule_prefix(filename):
+        """
+        start of the cache file names for one granule: its stem plus a
+        hash of the resolved path, so granules with the same name in
+        different directories get separate entries
+        """
+        hdf_path = Path(filename).resolve()
+        path_hash = hashlib.sha1(str(hdf_path).encode()).hexdigest()[:8]
+        return f"{hdf_path.stem}-{path_hash}"
+
+    def read_cloudsat_vars(self, varnames, filename, **read_kwargs):
+        """
+        return sat_lib.cloudsat.read_cloudsat_vars(varnames, filename, **read_kwargs)
+        from the cache, decoding the granule and storing it on a miss
+
+        Parameters
+        ----------
+
+        varnames: list of str
+           names of cloudsat variables
+
+        filename: str or Path object
+           path to the cloudsat hdf file
+
+        read_kwargs: dict
+           keyword arguments for read_cloudsat_vars (time_range, bbox, ...)
+
+        Returns
+        -------
+
+        the_data: xarray Dataset
+           dataset loaded into memory, whether it came from the cache
+           or was just read
+        """
+        read_kwargs.pop("lazy", None)
+        the_path = self.cache_path(varnames, filename, **read_kwargs)
+        if the_path.is_file():
+            #
+            # touch the entry so it counts as recently used
+            #
+            os.utime(the_path)
+            return xarray.load_dataset(the_path)
+        the_data = read_cloudsat_vars(varnames, filename, **read_kwargs).load()
+        self.put(the_data, the_path)
+        return the_data
+
+    def put(self, the_data, the_path):
+        """
+        write the_data to the_path as compressed netcdf, then evict
+        old entries if the cache is over max_bytes
+        """
+        encoding = {}
+        for name, the_var in the_data.variables.items():
+            if the_var.dtype.kind not in "fiu" or the_var.ndim == 0:
+                continue
+            chunksizes = tuple(min(self.chunk_profiles, length) if dim == "time" else length
+                               for dim, length in zip(the_var.dims, the_var.shape))
+            encoding[name] = dict(zlib=True, complevel=4, chunksizes=chunksizes)
+        tmp_path = the_path.with_suffix(f".tmp{os.getpid()}")
+        the_data.to_netcdf(tmp_path, encoding=encoding)
+        os.replace(tmp_path, the_path)
+        self.evict()
+
+    def entries(self):
+        """
+        list of cache files, least recently used first
+        """
+        the_files = list(self.cache_dir.glob("*.nc"))
+        the_files.sort(key=lambda the_file: the_file.stat().st_mtime)
+        return the_files
+
+    def evict(self):
+        """
+        delete least recently used entries until the cache is under max_bytes
+        """
+        the_files = self.entries()
+        total = sum(the_file.stat().st_size for the_file in the_files)
+        for the_file in the_files:
+            if total <= self.max_bytes:
+                break
+            total -= the_file.stat().st_size
+            the_file.unlink(missing_ok=True)
+
+    def invalidate(self, filename=None):
+        """
+        delete the cache entries for the granule filename, or every
+        entry if filename is None
+        """
+        if filename is None:
+            pattern = "*.nc"
+        else:
+            pattern = f"{self._granule_prefix(filename)}-*.nc"
+        for the_file in self.cache_dir.glob(pattern):
+            the_file.unlink(missing_ok=True)
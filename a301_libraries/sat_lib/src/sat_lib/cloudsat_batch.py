@@ -0,0 +1,170 @@
+"""
+  batch reading of cloudsat granules
+  __________________________________
+
+  read the same variables from many cloudsat hdf files in a process pool
+  (pyhdf is not thread-safe), either concatenating the granules along time
+  or writing one netcdf file per granule.  A granule that fails to read is
+  reported and skipped instead of stopping the batch.
+
+  to run from the command line::
+
+    cloudsat_batch /data/cloudsat/2008 -v Radar_Reflectivity -v QR --outdir ncfiles
+
+    or
+
+    cloudsat_batch "2008*FLXHR*.hdf" -v QR --output storm.nc --nprocs 32
+"""
+import hashlib
+from collections import Counter
+from importlib.metadata import version, PackageNotFoundError
+from pathlib import Path
+
+import click
+
+from .hdf4_catalog import find_granules
+from .parallel import map_files
+
+try:
+    __version__ = version("sat_lib")
+except PackageNotFoundError:
+    __version__ = "unknown version"
+
+
+def _out_name(filename, duplicate_stems):
+    """
+    netcdf file name for a granule: its stem, plus a hash of its full
+    path if another input has the same stem
+    """
+    the_path = Path(filename)
+    if the_path.stem not in duplicate_stems:
+        return f"{the_path.stem}.nc"
+    path_hash = hashlib.sha1(str(the_path.resolve()).encode()).hexdigest()[:8]
+    return f"{the_path.stem}-{path_hash}.nc"
+
+
+def _read_granule(filename, varnames, outdir, read_kwargs, duplicate_stems=()):
+    """
+    worker for batch_read: read one granule and either return the dataset
+    or write it to outdir and return the output path
+    """
+    from .cloudsat import read_cloudsat_vars
+    the_data = read_cloudsat_vars(varnames, filename, **read_kwargs)
+    if outdir is not None:
+        out_path = Path(outdir) / _out_name(filename, duplicate_stems)
+        the_data.to_netcdf(out_path)
+        the_data = out_path
+    return the_data
+
+
+def batch_read(inputs, varnames, outdir=None, nprocs=None, progress=False, **read_kwargs):
+    """
+    read varnames from every cloudsat granule in inputs using a process pool
+
+    Parameters
+    ----------
+
+    inputs: list of str or Path objects
+       files, directories or glob patterns, see find_granules
+    varnames: list of str
+       names of cloudsat variables, passed to read_cloudsat_vars
+    outdir: str or Path object or None
+       if given, write one netcdf file per granule into outdir instead of
+       returning the datasets.  Files are named after the granule; if two
+       inputs share a name, a hash of the full path is added to both
+    nprocs: int or None
+       number of worker processes, defaults to os.cpu_count()
+    progress: bool
+       print a line as each granule finishes
+    read_kwargs: dict
+       other keyword arguments for read_cloudsat_vars (time_range, bbox, ...)
+
+    Returns
+    -------
+
+    (results, errors): dict, dict
+       results maps each granule path to its Dataset (or output path if outdir
+       is set), in time order; errors maps each failed granule to its traceback
+    """
+    granules = find_granules(inputs)
+    if outdir is not None:
+        Path(outdir).mkdir(parents=True, exist_ok=True)
+    stem_counts = Counter(the_file.stem for the_file in granules)
+    duplicate_stems = {stem for stem, count in stem_counts.items() if count > 1}
+    results, errors = {}, {}
+    finished = map_files(_read_granule, granules, nprocs=nprocs, ordered=False,
+                         varnames=varnames, outdir=outdir, read_kwargs=read_kwargs,
+                         duplicate_stems=duplicate_stems)
+    for count, (filename, the_data, error) in enumerate(finished, start=1):
+        if error is None:
+            results[filename] = the_data
+        else:
+            errors[filename] = error
+        if progress:
+            status = "ok" if error is None else "FAILED"
+            print(f"[{count}/{len(granules)}] {status} {filename.name}")
+    results = {the_file: results[the_file] for the_file in granules if the_file in results}
+    return results, errors
+
+
+def concat_granules(datasets):
+    """
+    concatenate granule datasets along time.  The height axis of the first
+    granule is used for all of them, and attributes that differ between
+    granules (granule_id, orbit times) are dropped
+
+    Parameters
+    ----------
+
+    datasets: list of xarray Datasets
+       returned by read_cloudsat_vars, in time order
+
+    Returns
+    -------
+
+    the_data: xarray Dataset
+    """
+    import xarray
+    the_data = xarray.concat(datasets, dim='time', coords='minimal',
+                             compat='override', join='override',
+                             combine_attrs='drop_conflicts')
+    return the_data
+
+
+@click.command()
+@click.version_option(__version__)
+@click.argument('inputs', type=str, nargs=-1, required=True)
+@click.option('--var', '-v', 'varnames', multiple=True, required=True,
+              help="cloudsat variable to read, can be repeated")
+@click.option('--outdir', '-d', type=str, default=None,
+              help="write one netcdf file per granule into this directory")
+@click.option('--output', '-o', type=str, default=None,
+              help="concatenate all granules along time into this netcdf file")
+@click.option('--nprocs', '-n', type=int, default=None,
+              help="number of worker processes (default: all cores)")
+def main(inputs, varnames, outdir, output, nprocs):
+    """
+    read cloudsat variables from many granules in parallel
+
+    Parameters
+    ----------
+
+    inputs: hdf files, directories or glob patterns
+
+    Returns
+    -------
+
+    side effect: netcdf files in outdir, or one concatenated netcdf file
+    """
+    if (outdir is None) == (output is None):
+        raise click.UsageError("give exactly one of --outdir or --output")
+    results, errors = batch_read(inputs, list(varnames), outdir=outdir, nprocs=nprocs,
+                                 progress=True)
+    if output is not None and results:
+        the_data = concat_granules(list(results.values()))
+        the_data.to_netcdf(output)
+        print(f"wrote {len(results)} granules to {output}")
+    for filename, error in errors.items():
+        print(f"\nerror reading {filename}:\n{error}")
+    if errors:
+        raise SystemExit(1)
@@ -0,0 +1,152 @@
+"""
+  5 km to 1 km MODIS geolocation
+  ______________________________
+
+  MYD021KM and MYD05_L2 files carry Latitude/Longitude on a 5 km grid,
+  sampled at 1 km pixels (5*i + 2, 5*j + 2).  interpolate_geolocation
+  expands them back to every 1 km pixel so radiances can be resampled at
+  full resolution without a MYD03 file.  Interpolation is done on 3-D
+  unit vectors, so it is smooth across the antimeridian and near the
+  poles, and rows are only interpolated within a scan, because the
+  bow-tie overlap makes neighbouring scans discontinuous.
+"""
+import numpy as np
+
+#
+# 1 km rows per MODIS scan and 1 km pixels per 5 km pixel
+#
+SCAN_ROWS_1KM = 10
+FACTOR_5KM = 5
+#
+# 1 km pixels across track, for both the 271 column (MYD021KM) and the
+# 270 column (MYD05_L2, MYD35_L2) 5 km grids
+#
+NCOLS_1KM = 1354
+EARTH_RADIUS_KM = 6371.
+
+
+def lonlat_to_xyz(lons, lats):
+    """
+    convert longitude, latitude in degrees to unit vectors, stacked on
+    a new last axis
+    """
+    lon_rad, lat_rad = np.radians(lons), np.radians(lats)
+    cos_lat = np.cos(lat_rad)
+    return np.stack([cos_lat*np.cos(lon_rad), cos_lat*np.sin(lon_rad),
+                     np.sin(lat_rad)], axis=-1)
+
+
+def xyz_to_lonlat(xyz):
+    """
+    convert vectors stacked on the last axis (need not be unit length)
+    back to longitude, latitude in degrees
+    """
+    x, y, z = xyz[..., 0], xyz[..., 1], xyz[..., 2]
+    lons = np.degrees(np.arctan2(y, x))
+    lats = np.degrees(np.arctan2(z, np.hypot(x, y)))
+    return lons, lats
+
+
+def _interp_axis(values, npoints, axis, factor=FACTOR_5KM):
+    """
+    linearly interpolate values sampled at 1 km positions factor*j + factor//2
+    along axis onto 1 km positions 0..npoints-1, extrapolating from the end
+    pairs of samples
+    """
+    nsamples = values.shape[axis]
+    centre = factor//2
+    positions = np.arange(npoints)
+    left = np.clip((positions - centre)//factor, 0, nsamples - 2)
+    weight = (positions - (factor*left + centre))/factor
+    shape = [1]*values.ndim
+    shape[axis] = npoints
+    weight = weight.reshape(shape)
+    first = np.take(values, left, axis=axis)
+    second = np.take(values, left + 1, axis=axis)
+    return first + weight*(second - first)
+
+
+def interpolate_geolocation(lons_5km, lats_5km, ncols=None,
+                            scan_rows=SCAN_ROWS_1KM, factor=FACTOR_5KM):
+    """
+    expand MODIS 5 km longitudes and latitudes to the 1 km grid
+
+    Parameters
+    ----------
+
+    lons_5km, lats_5km: ndarray
+       (rows, cols) 5 km geolocation, e.g. (406, 271) from read_plainvar
+    ncols: int or None
+       number of 1 km columns, default NCOLS_1KM (1354 for MODIS)
+    scan_rows: int
+       1 km rows per scan (10 for MODIS)
+    factor: int
+       1 km pixels per 5 km pixel
+
+    Returns
+    -------
+
+    lons_1km, lats_1km: ndarray
+       (factor*rows, ncols) geolocation, same dtype as the input
+    """
+    nrows_5km, ncols_5km = lats_5km.shape
+    scan_rows_5km = scan_rows//factor
+    if nrows_5km % scan_rows_5km != 0:
+        raise ValueError(f"{nrows_5km=} is not a whole number of {scan_rows_5km}-row scans")
+    if ncols is None:
+        ncols = NCOLS_1KM
+    nscans = nrows_5km//scan_rows_5km
+    xyz = lonlat_to_xyz(np.asarray(lons_5km, dtype=np.float64),
+                        np.asarray(lats_5km, dtype=np.float64))
+    #
+    # interpolate rows inside each scan only, then columns
+    #
+    xyz = xyz.reshape(nscans, scan_rows_5km, ncols_5km, 3)
+    xyz = _interp_axis(xyz, scan_rows, axis=1, factor=factor)
+    xyz = xyz.reshape(nscans*scan_rows, ncols_5km, 3)
+    xyz = _interp_axis(xyz, ncols, axis=1, factor=factor)
+    lons_1km, lats_1km = xyz_to_lonlat(xyz)
+    return lons_1km.astype(lons_5km.dtype), lats_1km.astype(lats_5km.dtype)
+
+
+def read_geolocation_1km(the_file, ncols=None):
+    """
+    read the 5 km Latitude/Longitude from a MODIS hdf4 file and return
+    them interpolated to 1 km
+
+    Parameters
+    ----------
+
+    the_file: str or Path
+       MYD021KM, MYD05_L2 or other file with 5 km Latitude and Longitude
+    ncols: int or None
+       number of 1 km columns, see interpolate_geolocation
+
+    Returns
+    -------
+
+    lons_1km, lats_1km: ndarray
+    """
+    from .modischan_read import read_plainvar
+    lons_5km = read_plainvar(the_file, 'Longitude')
+    lats_5km = read_plainvar(the_file, 'Latitude')
+    return interpolate_geolocation(lons_5km, lats_5km, ncols=ncols)
+
+
+def geolocation_error_km(lons, lats, ref_lons, ref_lats):
+    """
+    great circle distance in km between interpolated and reference
+    (e.g. MYD03) geolocation, to check interpolate_geolocation
+
+    Returns
+    -------
+
+    error_dict: dict
+       max, mean and 99th percentile distance in km
+    """
+    xyz = lonlat_to_xyz(lons, lats)
+    ref_xyz = lonlat_to_xyz(ref_lons, ref_lats)
+    chord = np.linalg.norm(xyz - ref_xyz, axis=-1)
+    distance = 2.*EARTH_RADIUS_KM*np.arcsin(np.clip(chord/2., 0., 1.))
+    return dict(max=float(np.nanmax(distance)), mean=float(np.nanmean(distance)),
+                p99=float(np.nanpercentile(distance, 99)))
@@ -0,0 +1,281 @@
+"""
+  hdf4 variable catalog
+  _____________________
+
+  one walk of the "Data Fields" vgroup (or of the SD datasets for files
+  without one) gives a dictionary with the ref, shape, dtype, fill value,
+  scale factor and offset of every Vdata and SDS.  variable_catalog caches
+  it per file, keyed by path and mtime, so repeated variable lookups in
+  the same process are a dict hit.  Used by hdf4_inspect and
+  sat_lib.cloudsat.CloudsatFile.
+
+  only pyhdf is imported here, so the command line tools that use this
+  module start quickly
+"""
+import glob
+from pathlib import Path
+
+import numpy as np
+from pyhdf.error import HDF4Error
+from pyhdf.HDF import HDF, HC
+from pyhdf.SD import SD, SDC
+import pyhdf.V
+import pyhdf.VS
+
+#
+# hdf4 number type -> numpy dtype name
+#
+HDF4_DTYPES = {
+    HC.CHAR8: "S1",
+    HC.UCHAR8: "uint8",
+    HC.INT8: "int8",
+    HC.UINT8: "uint8",
+    HC.INT16: "int16",
+    HC.UINT16: "uint16",
+    HC.INT32: "int32",
+    HC.UINT32: "uint32",
+    HC.FLOAT32: "float32",
+    HC.FLOAT64: "float64",
+}
+
+#
+# attribute names tried, in order, for the fill value, scale factor and
+# offset: SDS attributes (MODIS style) and then "name.missing" style
+# swath attributes (cloudsat style)
+#
+_FILL_NAMES = ["_FillValue", "missing_value", "missing"]
+_FACTOR_NAMES = ["scale_factor", "factor"]
+_OFFSET_NAMES = ["add_offset", "offset"]
+
+#
+# path -> (mtime_ns, size, catalog)
+#
+_catalog_cache = {}
+MAX_CACHED_FILES = 256
+
+
+def find_granules(inputs, pattern="*.hdf"):
+    """
+    expand a list of files, directories and glob patterns into a sorted
+    list of hdf files
+
+    Parameters
+    ----------
+
+    inputs: list of str or Path objects
+       files, directories (searched for pattern) or glob patterns
+    pattern: str
+       glob pattern used inside directories
+
+    Returns
+    -------
+
+    granules: list of Path objects
+       sorted, without duplicates
+    """
+    if isinstance(inputs, (str, Path)):
+        inputs = [inputs]
+    granules = set()
+    for the_input in inputs:
+        the_path = Path(the_input)
+        if the_path.is_dir():
+            granules.update(the_path.glob(pattern))
+        elif the_path.is_file():
+            granules.add(the_path)
+        else:
+            granules.update(Path(the_file) for the_file in glob.glob(str(the_input)))
+    return sorted(the_file.resolve() for the_file in granules)
+
+
+def read_swath_attributes(v,vs):
+    ref = v.find('Swath Attributes')
+    vg = v.attach(ref)
+    members = vg.tagrefs()
+    attr_dict = {}
+    for tag, ref in members:
+        if tag == HC.DFTAG_VH:
+            vd = vs.attach(ref)
+            nrecs, intmode, fields, size, name = vd.inquire()
+            value = vd.read()
+            attr_dict[name] = value
+            vd.detach()
+    vg.detach()
+    return attr_dict
+
+
+def plain_value(value):
+    """
+    squeeze a Vdata record list or attribute to a python scalar, or a
+    list if it has more than one element
+    """
+    value = np.array(value).squeeze()
+    return value.tolist()
+
+
+def _lookup(name, var_attrs, swath_attrs, attr_names):
+    """
+    return the first of attr_names found in the SDS attributes, or as
+    name.attr_name in the swath attributes, or None
+    """
+    for attr_name in attr_names:
+        if attr_name in var_attrs:
+            return plain_value(var_attrs[attr_name])
+    for attr_name in attr_names:
+        swath_name = f"{name}.{attr_name}"
+        if swath_name in swath_attrs:
+            return plain_value(swath_attrs[swath_name])
+    return None
+
+
+def _sds_row(sds, ref, swath_attrs):
+    """
+    catalog entry for an SDS
+    """
+    name, rank, dims, the_type, nattrs = sds.info()
+    var_attrs = sds.attributes()
+    shape = [dims] if rank == 1 else list(dims)
+    row_dict = dict(kind="sds", ref=ref, rank=rank, dims=dims, the_type=the_type,
+                    nattrs=nattrs, dtype=HDF4_DTYPES.get(the_type, str(the_type)),
+                    shape=shape,
+                    fill=_lookup(name, var_attrs, swath_attrs, _FILL_NAMES),
+                    factor=_lookup(name, var_attrs, swath_attrs, _FACTOR_NAMES),
+                    offset=_lookup(name, var_attrs, swath_attrs, _OFFSET_NAMES))
+    return name, row_dict
+
+
+def _vdata_row(vd, ref, swath_attrs):
+    """
+    catalog entry for a Vdata
+    """
+    nrecs, intmode, fields, size, name = vd.inquire()
+    field_info = vd.fieldinfo()
+    the_type, order = field_info[0][1], field_info[0][2]
+    shape = [nrecs] if order == 1 else [nrecs, order]
+    row_dict = dict(kind="vdata", ref=ref, nrecs=nrecs, intmod=intmode, fields=fields,
+                    size=size, dtype=HDF4_DTYPES.get(the_type, str(the_type)),
+                    shape=shape,
+                    fill=_lookup(name, {}, swath_attrs, _FILL_NAMES),
+                    factor=_lookup(name, {}, swath_attrs, _FACTOR_NAMES),
+                    offset=_lookup(name, {}, swath_attrs, _OFFSET_NAMES))
+    return name, row_dict
+
+
+def build_catalog(sd, v, vs, swath_attrs=None):
+    """
+    walk the Data Fields vgroup of an open hdf4 file and describe every
+    Vdata and SDS in it.  Files without a Data Fields vgroup (e.g. MODIS
+    files written without HDF-EOS structure) list all SD datasets instead
+
+    Parameters
+    ----------
+
+    sd, v, vs: pyhdf SD, V and VS interfaces for the file
+    swath_attrs: dict or None
+       swath attributes from read_swath_attributes, used to find
+       name.missing, name.factor and name.offset values
+
+    Returns
+    -------
+
+    var_dict: dict
+       variable name -> dict with kind ("sds" or "vdata"), ref, dtype,
+       shape, fill, factor and offset, plus rank/dims/the_type/nattrs for
+       an SDS and nrecs/intmod/fields/size for a Vdata
+    """
+    if swath_attrs is None:
+        swath_attrs = {}
+    var_dict = dict()
+    try:
+        ref = v.find('Data Fields')
+    except HDF4Error:
+        ref = 0
+    if ref == 0:
+        for index in range(sd.info()[0]):
+            sds = sd.select(index)
+            name, row_dict = _sds_row(sds, sds.ref(), swath_attrs)
+            sds.endaccess()
+            var_dict[name] = row_dict
+        return var_dict
+    vg = v.attach(ref)
+    members = vg.tagrefs()
+    for tag, ref in members:
+        # Vdata tag
+        if tag == HC.DFTAG_VH:
+            vd = vs.attach(ref)
+            name, row_dict = _vdata_row(vd, ref, swath_attrs)
+            vd.detach()
+            var_dict[name] = row_dict
+        elif tag == HC.DFTAG_NDG:
+            sds = sd.select(sd.reftoindex(ref))
+            name, row_dict = _sds_row(sds, ref, swath_attrs)
+            sds.endaccess()
+            var_dict[name] = row_dict
+    vg.detach()
+    return var_dict
+
+
+def variable_catalog(filename, sd=None, v=None, vs=None, swath_attrs=None):
+    """
+    return the build_catalog dictionary for filename, from the cache if the
+    file's path, mtime and size are unchanged
+
+    Parameters
+    ----------
+
+    filename: str or Path object
+       hdf4 file
+    sd, v, vs: pyhdf interfaces or None
+       already open interfaces for filename, used on a cache miss instead
+       of opening the file again
+    swath_attrs: dict or None
+       swath attributes, read from the file if needed and not given
+
+    Returns
+    -------
+
+    var_dict: dict
+       see build_catalog.  Shared between callers, so don't modify it
+    """
+    the_path = Path(filename).resolve()
+    stat = the_path.stat()
+    key = str(the_path)
+    cached = _catalog_cache.get(key)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    if sd is None:
+        sd = SD(key, SDC.READ)
+        hdf = HDF(key, HC.READ)
+        vs = hdf.vstart()
+        v = hdf.vgstart()
+        try:
+            var_dict = _catalog_with_attrs(sd, v, vs, swath_attrs)
+        finally:
+            v.end()
+            vs.end()
+            sd.end()
+            hdf.close()
+    else:
+        var_dict = _catalog_with_attrs(sd, v, vs, swath_attrs)
+    if len(_catalog_cache) >= MAX_CACHED_FILES:
+        _catalog_cache.pop(next(iter(_catalog_cache)))
+    _catalog_cache[key] = (stat.st_mtime_ns, stat.st_size, var_dict)
+    return var_dict
+
+
+def _catalog_with_attrs(sd, v, vs, swath_attrs):
+    """
+    build_catalog, reading the swath attributes first if the file has them
+    """
+    if swath_attrs is None:
+        try:
+            swath_attrs = read_swath_attributes(v, vs)
+        except HDF4Error:
+            swath_attrs = {}
+    return build_catalog(sd, v, vs, swath_attrs=swath_attrs)
+
+
+def clear_catalog_cache():
+    """
+    forget all cached catalogs
+    """
+    _catalog_cache.clear()
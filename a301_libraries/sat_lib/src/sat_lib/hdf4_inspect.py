@@ -1,12 +1,24 @@
+"""
+  print the variables in hdf4 files
+  _________________________________
+
+  for each file, list every Vdata and SDS in the Data Fields vgroup with
+  its dimensions, or with --json write dtype, shape, fill, factor and
+  offset for each variable.  Directories and glob patterns are expanded
+  to all the hdf files they contain::
+
+    hdf4_inspect 2008082060027_10105_CS_2B-GEOPROF_GRANULE_P1_R05_E02_F00.hdf
+
+    hdf4_inspect /data/cloudsat --json > catalog.json
+"""
 import click
-from pathlib import Path
+import json
 from importlib.metadata import version, PackageNotFoundError
+from pyhdf.error import HDF4Error
 from pyhdf.HDF import *
 from pyhdf.V   import *
 from pyhdf.VS  import *
-from pyhdf.SD  import *
-from .modischan_read import sd_open_file
-from .cloudsat import read_swath_attributes
+from .hdf4_catalog import find_granules, read_swath_attributes, variable_catalog, plain_value
 import pprint
 pp = pprint.PrettyPrinter(indent=4)
 
@@ -16,6 +28,11 @@ try:
 except PackageNotFoundError:
     __version__ = "unknown version"
 
+#
+# catalog keys written by --json
+#
+JSON_KEYS = ["kind", "dtype", "shape", "fill", "factor", "offset"]
+
 
 def format_line(line_dict):
     if 'dims' in line_dict:
@@ -25,67 +42,94 @@ def format_line(line_dict):
         line = f"dims: [{line_dict['nrecs']}]"
     return line
 
+
+def read_attributes(hdfname):
+    """
+    return the swath attributes of hdfname, or an empty dict if the file
+    has no Swath Attributes vgroup
+    """
+    hdf = HDF(hdfname, HC.READ)
+    vs = hdf.vstart()
+    v  = hdf.vgstart()
+    try:
+        attr_dict = read_swath_attributes(v,vs)
+    except HDF4Error:
+        attr_dict = {}
+    finally:
+        v.end()
+        vs.end()
+        hdf.close()
+    return attr_dict
+
+
+def file_summary(hdfname, verbose=False):
+    """
+    json-ready description of the variables in one file
+
+    Parameters
+    ----------
+
+    hdfname: str
+       path to an hdf4 file
+    verbose: bool
+       include the swath attributes
+
+    Returns
+    -------
+
+    summary: dict
+       variables: name -> dict with JSON_KEYS, and attributes if verbose
+    """
+    var_dict = variable_catalog(hdfname)
+    variables = {key: {item: var_dict[key][item] for item in JSON_KEYS}
+                 for key in sorted(var_dict.keys())}
+    summary = dict(variables=variables)
+    if verbose:
+        attr_dict = read_attributes(hdfname)
+        summary["attributes"] = {key: plain_value(value) for key, value in attr_dict.items()}
+    return summary
+
+
 @click.command()
 @click.version_option(__version__)
 @click.option('--verbose', '-v', is_flag=True, help="Print all attributes")
-@click.argument('hdf_file',type=str,nargs=1)
-def main(hdf_file,verbose):
+@click.option('--json', 'as_json', is_flag=True,
+              help="write dtype, shape, fill, factor and offset for each variable as json")
+@click.argument('hdf_files',type=str,nargs=-1,required=True)
+def main(hdf_files,verbose,as_json):
     """
-    print information about an hdf4 file
+    print information about one or more hdf4 files
 
     Parameters
     ----------
 
-    hdf_file: path or str to hdf data
+    hdf_files: hdf files, directories or glob patterns
 
     Returns
     -------
 
-    side effect: printing the hdf_file info
+    side effect: printing the hdf_file info, or a json object keyed by
+    file path
     """
-    hdf_path = Path(hdf_file).resolve()
-    if not hdf_path.is_file():
-        raise ValueError("could not fine {hdf_path}")
-    hdfname=str(hdf_path)
-    sd = sd_open_file(hdfname)
-    hdf = HDF(hdfname, HC.READ)
-    vs = hdf.vstart()
-    v  = hdf.vgstart()
-    attr_dict = read_swath_attributes(v,vs)
-    ref = v.find('Data Fields')
-    vg = v.attach(ref)
-    members = vg.tagrefs()
-    var_dict = dict()
-    #
-    # build a dictionary with all variable names
-    #
-    for tag, ref in members:
-        # Vdata tag
-        if tag == HC.DFTAG_VH:
-            vd = vs.attach(ref)
-            nrecs, intmode, fields, size, name = vd.inquire()
-            # nrecs, intmode, fields, size, name = vd.inquire()
-            # nrecs.append(vd.inquire()[0]) # number of records of the Vdata
-            # names.append(vd.inquire()[-1])# name of the Vdata
-            vd.detach()
-            row_dict = dict(ref=ref,nrecs=nrecs,intmod=intmode,fields=fields,size=size)
-            var_dict[name] = row_dict
-        elif tag == HC.DFTAG_NDG:
-            sds = sd.select(sd.reftoindex(ref))
-            name, rank, dims, the_type, nattrs = sds.info()
-            row_dict = dict(ref=ref,rank=rank,dims=dims,the_type=the_type,nattrs=nattrs)
-            var_dict[name] = row_dict
-            sds.endaccess()
-    key_list = list(var_dict.keys())
-    key_list.sort()
-    for key in key_list:
-        value = var_dict[key]
-        dims = format_line(value)
-        print(f"{key}: {dims}")
-    if verbose:
-        print("\nAttributes\n")
-        pp.pprint(attr_dict)
-    v.end()
-    vs.end()
-    sd.end()
-    hdf.close()
+    hdf_paths = find_granules(hdf_files)
+    if not hdf_paths:
+        raise ValueError(f"could not find any hdf files in {hdf_files}")
+    if as_json:
+        out = {str(hdf_path): file_summary(str(hdf_path), verbose=verbose)
+               for hdf_path in hdf_paths}
+        print(json.dumps(out, indent=2))
+        return
+    for hdf_path in hdf_paths:
+        hdfname=str(hdf_path)
+        if len(hdf_paths) > 1:
+            print(f"\n{hdfname}\n")
+        var_dict = variable_catalog(hdfname)
+        key_list = list(var_dict.keys())
+        key_list.sort()
+        for key in key_list:
+            value = var_dict[key]
+            dims = format_line(value)
+            print(f"{key}: {dims}")
+        if verbose:
+            print("\nAttributes\n")
+            pp.pprint(read_attributes(hdfname))
@@ -1,11 +1,13 @@
 import copy
+import logging
 import numpy as np
-from pystac_client import Client
-from shapely.geometry import Point
-from rasterio.windows import Window
-from pyproj import CRS
-import rioxarray
-from xarray import Dataset
+from .timing import timed
+#
+# pystac_client, shapely, rioxarray, xarray and pyproj are imported inside
+# the functions that use them, so importing this module is fast
+#
+
+logger = logging.getLogger(__name__)
 
 def get_clear_mask(fmask_ds):
     """
@@ -104,6 +106,9 @@ def get_landsat_scene(date, lon, lat, window):
     out_dict: dict
        dictionary with three rioxarray DataArrays: band4, band5, Fmask
     """
+    from pystac_client import Client
+    from shapely.geometry import Point
+    import rioxarray
     #
     # set up the search -- we are looking for only 1 scene per date
     #
@@ -116,8 +121,9 @@ def get_landsat_scene(date, lon, lat, window):
         intersects=the_point,
         datetime= date
     )
-    items = search.get_all_items()
-    print(f"found {len(items)} item")
+    with timed("stac search"):
+        items = search.get_all_items()
+    logger.debug("found %d item", len(items))
     #
     # get the metadata and add date, cloud_cover and band_name to the new DataArrays
     #
@@ -126,13 +132,16 @@ def get_landsat_scene(date, lon, lat, window):
     band_names = ['B04','B05','Fmask']
     array_names = ['b4_ds','b5_ds','fmask_ds']
     for band,array_name in zip(band_names, array_names):
-        print(f"inside get_landsat_scene: reading {band} into {array_name}")
+        logger.debug("inside get_landsat_scene: reading %s into %s", band, array_name)
         href = items[0].assets[band].href
-        lazy_ds = rioxarray.open_rasterio(href,mask_and_scale=True)
+        with timed("open"):
+            lazy_ds = rioxarray.open_rasterio(href,mask_and_scale=True)
         #
-        # now read the window
+        # now read the window; load() so the timing covers the actual read
         #
-        clipped_ds = lazy_ds.rio.isel_window(window)
+        with timed("window read") as record:
+            clipped_ds = lazy_ds.rio.isel_window(window).load()
+            record["nbytes"] = clipped_ds.nbytes
         #
         # add some custom attributes
         #
@@ -179,6 +188,10 @@ def get_landsat_dataset(date, lon, lat, window, bands=None):
     the_dataset: xarray.Dataset
        dataset with rioxarrays of requested bands plus Fmask
     """
+    from pystac_client import Client
+    from shapely.geometry import Point
+    import rioxarray
+    from xarray import Dataset
     if bands is None:
         bands = ['B04','B05','B06']
     #
@@ -193,8 +206,9 @@ def get_landsat_dataset(date, lon, lat, window, bands=None):
         intersects=the_point,
         datetime= date
     )
-    items = search.get_all_items()
-    print(f"found {len(items)} item")
+    with timed("stac search"):
+        items = search.get_all_items()
+    logger.debug("found %d item", len(items))
     #
     # get the metadata and add date, cloud_cover and band_name to the new DataArrays
     #
@@ -202,13 +216,16 @@ def get_landsat_dataset(date, lon, lat, window, bands=None):
     out_dict = {}
     bands.extend(['Fmask'])
     for the_band in bands:
-        print(f"inside get_landsat_scene: reading {the_band}")
+        logger.debug("inside get_landsat_dataset: reading %s", the_band)
         href = items[0].assets[the_band].href
-        lazy_ds = rioxarray.open_rasterio(href,mask_and_scale=True)
+        with timed("open"):
+            lazy_ds = rioxarray.open_rasterio(href,mask_and_scale=True)
         #
-        # now read the window
+        # now read the window; load() so the timing covers the actual read
         #
-        clipped_ds = lazy_ds.rio.isel_window(window)
+        with timed("window read") as record:
+            clipped_ds = lazy_ds.rio.isel_window(window).load()
+            record["nbytes"] = clipped_ds.nbytes
         #
         # add some custom attributes
         #
@@ -231,7 +248,8 @@ def get_landsat_dataset(date, lon, lat, window, bands=None):
     out_dict['Fmask'] = get_clear_mask(out_dict['Fmask'])
     coords = out_dict['Fmask'].coords
     attrs = out_dict['Fmask'].attrs
-    dataset = Dataset(data_vars = out_dict, coords = coords, attrs = attrs )
+    with timed("dataset build"):
+        dataset = Dataset(data_vars = out_dict, coords = coords, attrs = attrs )
     dataset = dataset.squeeze()
     return dataset
 
@@ -242,6 +260,7 @@ def find_epsg_code(utm_zone, south=False):
     
     cartopy wants crs names as epsg codes, i.e. UTM zone 10N is EPSG:32610, 10S is EPSG:32710
     """
+    from pyproj import CRS
     crs = CRS.from_dict({'proj': 'utm', 'zone': utm_zone, 'south': south})
     epsg, code = crs.to_authority()
     cartopy_epsg_code = code
@@ -1,5 +1,16 @@
-import cartopy.crs as ccrs
-from pyresample import geometry
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from .cache import cache_root
+
+#
+# cartopy and pyresample are slow to import, so they are imported inside
+# the functions that need them
+#
 
 def get_proj_params(metadata):
     """
@@ -21,6 +32,7 @@ def get_proj_params(metadata):
     """
     
 
+    import cartopy.crs as ccrs
     globe = ccrs.Globe(datum="WGS84", ellipse="WGS84")
     projection = ccrs.LambertAzimuthalEqualArea(
         central_latitude=metadata["lat_0"],
@@ -147,5 +159,679 @@ def area_def_from_dict(area_def_dict):
     """
     keys=['area_id','proj_id','name','proj_dict','x_size','y_size','area_extent']    
     arglist=[area_def_dict.get(key,'unknown') for key in keys]
+    from pyresample import geometry
     area_def=geometry.AreaDefinition(*arglist)
     return area_def
+
+
+def swath_center(lons, lats):
+    """
+    center longitude and latitude of a set of points, from the mean of
+    their unit vectors so it works across the antimeridian
+
+    Returns
+    -------
+
+    lon_0, lat_0: float
+    """
+    from .geo_interp import lonlat_to_xyz, xyz_to_lonlat
+    xyz = lonlat_to_xyz(np.ravel(lons), np.ravel(lats))
+    xyz = np.nanmean(xyz, axis=0)
+    lon_0, lat_0 = xyz_to_lonlat(xyz)
+    return float(lon_0), float(lat_0)
+
+
+def laea_area_def(lons, lats, resolution, lon_0=None, lat_0=None, center_precision=0.5,
+                  area_id="laea_a301", name="human readable area def"):
+    """
+    smallest laea area_def with square pixels of size resolution that
+    covers the points lons, lats.  The projection center is rounded to
+    center_precision degrees and the extent is snapped outward to whole
+    pixels, so granules over the same region tend to give the same grid
+
+    Parameters
+    ----------
+
+    lons, lats: ndarray
+       points to cover, in degrees (NaNs are ignored)
+    resolution: float
+       pixel size in meters
+    lon_0, lat_0: float or None
+       projection center, default from swath_center
+    center_precision: float or None
+       degrees to round the default center to, None for no rounding
+
+    Returns
+    -------
+
+    area_def: pyresample AreaDefinition
+       built with make_areadef_dict and area_def_from_dict
+    """
+    import pyproj
+    lons, lats = np.ravel(lons), np.ravel(lats)
+    good = np.isfinite(lons) & np.isfinite(lats)
+    lons, lats = lons[good], lats[good]
+    if lon_0 is None or lat_0 is None:
+        center_lon, center_lat = swath_center(lons, lats)
+        if center_precision:
+            center_lon = round(center_lon/center_precision)*center_precision
+            center_lat = round(center_lat/center_precision)*center_precision
+        lon_0 = center_lon if lon_0 is None else lon_0
+        lat_0 = center_lat if lat_0 is None else lat_0
+    proj = pyproj.Proj(proj="laea", lat_0=lat_0, lon_0=lon_0, datum="WGS84", units="m")
+    x, y = proj(lons, lats)
+    ll_x = np.floor(np.min(x)/resolution)*resolution
+    ll_y = np.floor(np.min(y)/resolution)*resolution
+    x_size = int(np.ceil(np.max(x)/resolution) - ll_x/resolution)
+    y_size = int(np.ceil(np.max(y)/resolution) - ll_y/resolution)
+    area_dict = make_areadef_dict(lat_0, lon_0, float(ll_x), float(ll_y), resolution,
+                                  resolution, x_size, y_size, area_id=area_id,
+                                  proj_id=area_id, name=name)
+    return area_def_from_dict(area_dict)
+
+
+def area_def_from_meta(metadata, resolution, points_per_edge=20, registry=None,
+                       grid_name=None, **kwargs):
+    """
+    laea area_def covering a granule, from the four corners returned by
+    parseMeta.  The edges between corners are filled in along great
+    circles, since they bulge in the projection
+
+    if registry and grid_name are given, the grid registered under
+    grid_name is returned when there is one, otherwise the new grid is
+    registered under that name, so every granule in a study uses the same
+    grid (and the same cached resampling plans)
+
+    Parameters
+    ----------
+
+    metadata: dict
+       returned by parseMeta
+    resolution: float
+       pixel size in meters
+    points_per_edge: int
+       points interpolated along each edge of the corner polygon
+    registry: GridRegistry or None
+    grid_name: str or None
+    kwargs: dict
+       passed to laea_area_def (lon_0, lat_0, center_precision, area_id ...)
+
+    Returns
+    -------
+
+    area_def: pyresample AreaDefinition
+    """
+    if registry is not None and grid_name is not None and grid_name in registry:
+        return registry.get(grid_name)
+    from .geo_interp import lonlat_to_xyz, xyz_to_lonlat
+    corners = lonlat_to_xyz(np.asarray(metadata["lon_list"], dtype=np.float64),
+                            np.asarray(metadata["lat_list"], dtype=np.float64))
+    fraction = np.linspace(0., 1., points_per_edge, endpoint=False)[:, np.newaxis]
+    edges = [corners[index] + fraction*(corners[(index + 1) % len(corners)] - corners[index])
+             for index in range(len(corners))]
+    lons, lats = xyz_to_lonlat(np.concatenate(edges))
+    area_def = laea_area_def(lons, lats, resolution, **kwargs)
+    if registry is not None and grid_name is not None:
+        registry.register(area_def, grid_name)
+    return area_def
+
+
+def swath_outline(lons, lats, stride=10):
+    """
+    every stride'th row and column of a swath plus all of its edge
+    pixels: enough points to find the swath's extent in any projection
+    without projecting every pixel
+
+    Parameters
+    ----------
+
+    lons, lats: ndarray
+       2-D swath geolocation
+    stride: int
+       subsampling of the interior points
+
+    Returns
+    -------
+
+    lon_points, lat_points: ndarray
+       1-D arrays of the selected points
+    """
+    lons, lats = np.asarray(lons), np.asarray(lats)
+    points = [(lons[::stride, ::stride], lats[::stride, ::stride]),
+              (lons[[0, -1], :], lats[[0, -1], :]),
+              (lons[:, [0, -1]], lats[:, [0, -1]])]
+    lon_points = np.concatenate([np.ravel(the_lons) for the_lons, the_lats in points])
+    lat_points = np.concatenate([np.ravel(the_lats) for the_lons, the_lats in points])
+    return lon_points, lat_points
+
+
+def area_def_from_swath(lons, lats, resolution, stride=10, registry=None, grid_name=None,
+                        **kwargs):
+    """
+    laea area_def covering a swath, from its longitude and latitude
+    arrays.  Only every stride'th row and column plus the swath edges
+    are used.  See area_def_from_meta for registry and grid_name
+
+    Parameters
+    ----------
+
+    lons, lats: ndarray
+       2-D swath geolocation
+    resolution: float
+       pixel size in meters
+    stride: int
+       subsampling of the interior points
+    kwargs: dict
+       passed to laea_area_def
+
+    Returns
+    -------
+
+    area_def: pyresample AreaDefinition
+    """
+    if registry is not None and grid_name is not None and grid_name in registry:
+        return registry.get(grid_name)
+    lon_points, lat_points = swath_outline(lons, lats, stride=stride)
+    area_def = laea_area_def(lon_points, lat_points, resolution, **kwargs)
+    if registry is not None and grid_name is not None:
+        registry.register(area_def, grid_name)
+    return area_def
+
+
+class GridRegistry:
+    """
+    named target grids, stored as area_def_to_dict dictionaries in one
+    json file so that the same grid (and so the same resampling plan
+    cache key) is used across granules and sessions
+
+    usage::
+
+        registry = GridRegistry()
+        area_def = area_def_from_meta(parseMeta(the_file), 5000,
+                                      registry=registry, grid_name="pha_5km")
+        ...
+        area_def = registry.get("pha_5km")
+
+    Parameters
+    ----------
+
+    path: str or Path object or None
+       json file, defaults to $SAT_LIB_CACHE/grids.json or
+       ~/.cache/sat_lib/grids.json
+    """
+    def __init__(self, path=None):
+        if path is None:
+            path = cache_root("grids.json")
+        self.path = Path(path)
+        self.grids = {}
+        if self.path.is_file():
+            with open(self.path, "r") as infile:
+                self.grids = json.load(infile)
+
+    def __contains__(self, grid_name):
+        return grid_name in self.grids
+
+    def names(self):
+        """
+        sorted list of registered grid names
+        """
+        return sorted(self.grids)
+
+    def get(self, grid_name):
+        """
+        return the area_def registered as grid_name
+        """
+        if grid_name not in self.grids:
+            raise KeyError(f"no grid called {grid_name} in {self.path}")
+        return area_def_from_dict(self.grids[grid_name])
+
+    def find(self, area_def):
+        """
+        name of a registered grid identical to area_def, or None
+        """
+        for grid_name in self.grids:
+            if self.get(grid_name) == area_def:
+                return grid_name
+        return None
+
+    def register(self, area_def, grid_name=None):
+        """
+        add area_def under grid_name (default its area_id) and save the
+        registry.  If an identical grid is already registered its name is
+        returned instead
+
+        Returns
+        -------
+
+        grid_name: str
+        """
+        existing = self.find(area_def)
+        if existing is not None:
+            return existing
+        if grid_name is None:
+            grid_name = area_def.area_id
+        if grid_name in self.grids:
+            raise ValueError(f"{grid_name} is already registered with a different grid")
+        area_dict = area_def_to_dict(area_def)
+        area_dict["area_extent"] = [float(item) for item in area_dict["area_extent"]]
+        area_dict["pixel_size_x"] = float(area_dict["pixel_size_x"])
+        area_dict["pixel_size_y"] = float(area_dict["pixel_size_y"])
+        self.grids[grid_name] = area_dict
+        self.save()
+        return grid_name
+
+    def save(self):
+        """
+        write the registry json file, replacing it atomically
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.stem}.tmp{os.getpid()}.json")
+        with open(tmp_path, "w") as outfile:
+            json.dump(self.grids, outfile, indent=4)
+        os.replace(tmp_path, self.path)
+
+
+def resample_cache_dir(cache_dir=None):
+    """
+    directory for saved resampling plans: cache_dir if given, else
+    $SAT_LIB_CACHE/resample or ~/.cache/sat_lib/resample
+    """
+    if cache_dir is None:
+        cache_dir = cache_root("resample")
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+def plan_key(lons, lats, area_def, **params):
+    """
+    hash of the swath geolocation, the target area and the resampling
+    parameters, used to name saved resampling plans
+
+    Parameters
+    ----------
+
+    lons, lats: ndarray
+       swath longitudes and latitudes
+    area_def: pyresample AreaDefinition
+       target grid
+    params: dict
+       anything else that changes the plan (method, radius_of_influence ...)
+
+    Returns
+    -------
+
+    key: str
+       24 hex digits
+    """
+    the_hash = hashlib.sha1()
+    for the_array in (lons, lats):
+        the_array = np.ascontiguousarray(the_array)
+        the_hash.update(f"{the_array.dtype.str}{the_array.shape}".encode())
+        the_hash.update(the_array.data)
+    area_items = [area_def.crs.to_wkt(), str(area_def.shape),
+                  str([float(item) for item in area_def.area_extent])]
+    area_items.extend(f"{key}={params[key]}" for key in sorted(params))
+    the_hash.update("|".join(area_items).encode())
+    return the_hash.hexdigest()[:24]
+
+
+#
+# resampling methods and the pyresample neighbour count each one uses
+#
+RESAMPLE_NEIGHBOURS = dict(nearest=1, bilinear=32, gaussian=8)
+
+
+class SwathResampler:
+    """
+    resampling of a swath onto an area_def with the neighbour search done
+    once.  The plan is saved in cache_dir under a hash of the geolocation,
+    area and method parameters, so a new resampler for the same swath and
+    area just loads it, and each call to resample is a single gather or
+    sparse matrix product
+
+    method "nearest" keeps, for each output pixel with a neighbour within
+    radius_of_influence, its flat output index, the flat swath index of
+    the neighbour and their distance.  "bilinear" (pyresample's bilinear
+    corners) and "gaussian" (weights exp(-d**2/sigma**2) over the
+    nearest neighbours, normalized) keep a scipy.sparse CSR matrix of
+    weights with one row per output pixel and one column per swath pixel
+
+    usage::
+
+        resampler = SwathResampler(lon_1km, lat_1km, area_def, radius_of_influence=5000)
+        image_31 = resampler.resample(ch31)
+        image_32 = resampler.resample(ch32)
+
+        smooth = SwathResampler(lon_5km, lat_5km, area_def, method="gaussian",
+                                radius_of_influence=10000, sigma=5000)
+        image_wv = smooth.resample(wv_data)
+
+    Parameters
+    ----------
+
+    lons, lats: ndarray
+       swath longitudes and latitudes (same 2-D shape as the channels)
+    area_def: pyresample AreaDefinition
+       target grid, e.g. from area_def_from_dict
+    radius_of_influence: float
+       largest distance in meters to a swath pixel
+    nprocs: int
+       processes used by pyresample for the neighbour search
+    cache_dir: str or Path object or None
+       where plans are saved, see resample_cache_dir
+    persist: bool
+       if False, don't read or write the plan on disk
+    method: str
+       "nearest", "bilinear" or "gaussian"
+    neighbours: int or None
+       swath pixels searched per output pixel, default from
+       RESAMPLE_NEIGHBOURS
+    sigma: float or None
+       gaussian width in meters, default radius_of_influence/2
+    """
+    def __init__(self, lons, lats, area_def, radius_of_influence=5000, nprocs=1,
+                 cache_dir=None, persist=True, method="nearest", neighbours=None,
+                 sigma=None):
+        if method not in RESAMPLE_NEIGHBOURS:
+            raise ValueError(f"{method=} should be one of {list(RESAMPLE_NEIGHBOURS)}")
+        if neighbours is None:
+            neighbours = RESAMPLE_NEIGHBOURS[method]
+        if sigma is None:
+            sigma = radius_of_influence/2.
+        self.swath_shape = np.shape(lons)
+        self.area_def = area_def
+        self.radius_of_influence = radius_of_influence
+        self.method = method
+        self.neighbours = neighbours
+        self.sigma = sigma
+        params = dict(method=method, radius_of_influence=radius_of_influence)
+        if method != "nearest":
+            params["neighbours"] = neighbours
+        if method == "gaussian":
+            params["sigma"] = sigma
+        self.key = None
+        self.plan_path = None
+        if persist:
+            self.key = plan_key(lons, lats, area_def, **params)
+            self.plan_path = resample_cache_dir(cache_dir) / f"{method}-{self.key}.npz"
+        if self.plan_path is not None and self.plan_path.is_file():
+            with np.load(self.plan_path) as plan:
+                self._set_plan(dict(plan))
+        else:
+            if method == "nearest":
+                self._find_neighbours(lons, lats, nprocs)
+            elif method == "bilinear":
+                self._bilinear_weights(lons, lats, nprocs)
+            else:
+                self._gaussian_weights(lons, lats, nprocs)
+            if self.plan_path is not None:
+                self.save(self.plan_path)
+
+    @property
+    def area_shape(self):
+        """
+        (rows, cols) of the target grid
+        """
+        return self.area_def.shape
+
+    def _set_plan(self, plan):
+        """
+        set the plan attributes from a dict of arrays as written by save
+        """
+        if self.method == "nearest":
+            self.target_index = plan["target_index"]
+            self.source_index = plan["source_index"]
+            self.distance = plan["distance"]
+        else:
+            from scipy import sparse
+            nout = self.area_shape[0]*self.area_shape[1]
+            nin = self.swath_shape[0]*self.swath_shape[1]
+            self.weights = sparse.csr_matrix(
+                (plan["weights_data"], plan["weights_indices"], plan["weights_indptr"]),
+                shape=(nout, nin))
+            self.target_index = np.flatnonzero(np.diff(self.weights.indptr) > 0)
+
+    def _find_neighbours(self, lons, lats, nprocs):
+        """
+        run the pyresample kd-tree search and keep only the output pixels
+        that have a neighbour
+        """
+        from pyresample import kd_tree, SwathDefinition
+        swath_def = SwathDefinition(lons, lats)
+        valid_input, valid_output, index_array, distance_array = kd_tree.get_neighbour_info(
+            swath_def, self.area_def, self.radius_of_influence, neighbours=1, nprocs=nprocs)
+        input_index = np.flatnonzero(valid_input)
+        output_index = np.flatnonzero(valid_output)
+        hit = index_array < len(input_index)
+        self.target_index = output_index[hit]
+        self.source_index = input_index[index_array[hit]]
+        self.distance = distance_array[hit].astype(np.float32)
+
+    def _make_weights(self, rows, cols, values):
+        """
+        build the CSR weight matrix from (output, swath, weight) triplets
+        """
+        from scipy import sparse
+        nout = self.area_shape[0]*self.area_shape[1]
+        nin = self.swath_shape[0]*self.swath_shape[1]
+        weights = sparse.csr_matrix((values.astype(np.float32), (rows, cols)),
+                                    shape=(nout, nin))
+        weights.sum_duplicates()
+        self._set_plan(dict(weights_data=weights.data, weights_indices=weights.indices,
+                            weights_indptr=weights.indptr))
+
+    def _gaussian_weights(self, lons, lats, nprocs):
+        """
+        weights exp(-d**2/sigma**2) for the nearest neighbours within
+        radius_of_influence, normalized to sum to 1 for each output pixel
+        """
+        from pyresample import kd_tree, SwathDefinition
+        swath_def = SwathDefinition(lons, lats)
+        valid_input, valid_output, index_array, distance_array = kd_tree.get_neighbour_info(
+            swath_def, self.area_def, self.radius_of_influence,
+            neighbours=self.neighbours, nprocs=nprocs)
+        input_index = np.flatnonzero(valid_input)
+        output_index = np.flatnonzero(valid_output)
+        index_array = index_array.reshape(len(output_index), -1)
+        distance_array = distance_array.reshape(len(output_index), -1)
+        hit = index_array < len(input_index)
+        weights = np.where(hit, np.exp(-(np.where(hit, distance_array, 0.)/self.sigma)**2), 0.)
+        total = weights.sum(axis=1, keepdims=True)
+        weights = np.divide(weights, total, out=np.zeros_like(weights), where=total > 0)
+        out_rows = np.broadcast_to(output_index[:, np.newaxis], hit.shape)[hit]
+        self._make_weights(out_rows, input_index[index_array[hit]], weights[hit])
+
+    def _bilinear_weights(self, lons, lats, nprocs):
+        """
+        corner weights (1-s)(1-t), s(1-t), (1-s)t and st from pyresample's
+        bilinear search, for output pixels with all four corners inside
+        the swath and 0 <= s, t <= 1
+        """
+        from pyresample import SwathDefinition
+        from pyresample.bilinear import NumpyBilinearResampler
+        swath_def = SwathDefinition(lons, lats)
+        bilinear = NumpyBilinearResampler(swath_def, self.area_def, self.radius_of_influence,
+                                          neighbours=self.neighbours)
+        bilinear.get_bil_info(nprocs=nprocs)
+        s, t = bilinear.bilinear_s, bilinear.bilinear_t
+        ncols = self.swath_shape[1]
+        corners = np.asarray(bilinear.slices_y)*ncols + np.asarray(bilinear.slices_x)
+        corner_weights = np.stack([(1 - s)*(1 - t), s*(1 - t), (1 - s)*t, s*t], axis=1)
+        eps = 1.e-6
+        with np.errstate(invalid='ignore'):
+            good = ((s >= -eps) & (s <= 1 + eps) & (t >= -eps) & (t <= 1 + eps)
+                    & ~np.asarray(bilinear.mask_slices).any(axis=1))
+        out_rows = np.repeat(np.flatnonzero(good), 4)
+        self._make_weights(out_rows, corners[good].reshape(-1), corner_weights[good].reshape(-1))
+
+    def save(self, plan_path):
+        """
+        write the plan to plan_path (.npz), replacing it atomically
+        """
+        plan_path = Path(plan_path)
+        tmp_path = plan_path.with_name(f"{plan_path.stem}.tmp{os.getpid()}.npz")
+        if self.method == "nearest":
+            np.savez(tmp_path, target_index=self.target_index,
+                     source_index=self.source_index, distance=self.distance)
+        else:
+            np.savez(tmp_path, weights_data=self.weights.data,
+                     weights_indices=self.weights.indices,
+                     weights_indptr=self.weights.indptr)
+        os.replace(tmp_path, plan_path)
+
+    def resample(self, data, fill_value=np.nan):
+        """
+        resample one channel, or a stack of channels, with the saved plan.
+        A stack is gathered (or multiplied by the weight matrix) in one
+        call over the flattened (band, pixel) array rather than band by
+        band.  For bilinear and gaussian, NaN swath pixels are left out
+        and the remaining weights renormalized
+
+        Parameters
+        ----------
+
+        data: ndarray
+           (row, col) array on the swath, same shape as lons, or a
+           (band, row, col) cube
+        fill_value: float
+           value for output pixels with no swath pixel within
+           radius_of_influence
+
+        Returns
+        -------
+
+        image: ndarray
+           (y, x) or (band, y, x) array on the area_def grid
+        """
+        data = np.asarray(data)
+        if data.shape[-2:] != self.swath_shape:
+            raise ValueError(f"{data.shape=} doesn't match swath shape {self.swath_shape}")
+        lead_shape = data.shape[:-2]
+        flat_data = data.reshape(lead_shape + (-1,))
+        if self.method == "nearest":
+            dtype = np.result_type(data.dtype, np.min_scalar_type(fill_value))
+            image = np.full(lead_shape + self.area_shape, fill_value, dtype=dtype)
+            flat_image = image.reshape(lead_shape + (-1,))
+            flat_image[..., self.target_index] = flat_data[..., self.source_index]
+            return image
+        dtype = np.result_type(data.dtype, np.float32)
+        columns = flat_data.reshape(-1, flat_data.shape[-1]).T.astype(dtype, copy=False)
+        valid = np.isfinite(columns)
+        if valid.all():
+            values = self.weights @ columns
+            has_value = np.zeros(values.shape, dtype=bool)
+            has_value[self.target_index] = True
+        else:
+            total = self.weights @ valid.astype(dtype)
+            values = self.weights @ np.where(valid, columns, 0)
+            has_value = total > 1.e-6
+            np.divide(values, total, out=values, where=has_value)
+        values[~has_value] = fill_value
+        image = values.T.reshape(lead_shape + self.area_shape).astype(dtype, copy=False)
+        return image
+
+    def resample_bands(self, the_data, band_names=None, input_fill=None, fill_value=np.nan):
+        """
+        resample a (band, row, col) cube, or a Dataset of (row, col) bands
+        such as read_modis_bands returns, into a Dataset on the area_def
+        grid with projected x/y coordinates and CF grid mapping metadata
+
+        Parameters
+        ----------
+
+        the_data: ndarray or xarray Dataset
+           (band, row, col) cube, or a Dataset whose variables all have
+           the swath shape
+        band_names: list of str or None
+           variable names for the cube bands, default ch0, ch1 ...
+           (ignored for a Dataset)
+        input_fill: float or None
+           swath value that marks missing data (e.g. -9999.); these
+           pixels are treated as NaN, so bilinear and gaussian average
+           only the valid neighbours
+        fill_value: float
+           value for missing data and pixels with no swath pixel within
+           radius_of_influence
+
+        Returns
+        -------
+
+        band_ds: xarray Dataset
+           one (y, x) DataArray per band, a scalar "crs" coordinate with
+           the CF grid mapping attributes, and area_id, area_extent and
+           crs_wkt as dataset attributes
+        """
+        import xarray
+        var_attrs = None
+        if isinstance(the_data, xarray.Dataset):
+            band_names = list(the_data.data_vars)
+            var_attrs = [the_data[name].attrs for name in band_names]
+            cube = np.stack([the_data[name].values for name in band_names])
+        else:
+            cube = np.asarray(the_data)
+            if cube.ndim == 2:
+                cube = cube[np.newaxis, ...]
+            if band_names is None:
+                band_names = [f"ch{index}" for index in range(cube.shape[0])]
+        #
+        # missing swath pixels become NaN before resampling, so the
+        # weighted methods leave them out instead of averaging them in
+        #
+        if input_fill is not None:
+            cube = np.where(cube == input_fill, np.nan, cube)
+        images = self.resample(cube, fill_value=fill_value)
+        if input_fill is not None and not np.isnan(fill_value):
+            images[np.isnan(images)] = fill_value
+        crs = self.area_def.crs
+        coords = dict(x=('x', self.area_def.projection_x_coords, dict(units='m')),
+                      y=('y', self.area_def.projection_y_coords, dict(units='m')),
+                      crs=((), 0, crs.to_cf()))
+        data_vars = {}
+        for index, name in enumerate(band_names):
+            attrs = dict(var_attrs[index]) if var_attrs is not None else {}
+            attrs['grid_mapping'] = 'crs'
+            data_vars[name] = (('y', 'x'), images[index], attrs)
+        attrs = dict(area_id=self.area_def.area_id,
+                     area_extent=[float(item) for item in self.area_def.area_extent],
+                     crs_wkt=crs.to_wkt())
+        band_ds = xarray.Dataset(data_vars=data_vars, coords=coords, attrs=attrs)
+        return band_ds
+
+
+def resample_bands(the_data, lons, lats, area_def, band_names=None, input_fill=None,
+                   fill_value=np.nan, radius_of_influence=5000, nprocs=1, cache_dir=None,
+                   method="nearest", **method_kwargs):
+    """
+    resample every band of the_data onto area_def in one call, reusing a
+    saved plan for this swath, area and method if there is one.  See
+    SwathResampler for the methods and SwathResampler.resample_bands
+
+    usage::
+
+        band_ds = read_modis_bands(radiance_file, [29, 31, 32])
+        lon_1km, lat_1km = read_geolocation_1km(radiance_file)
+        area_def = area_def_from_dict(area_dict)
+        grid_ds = resample_bands(band_ds, lon_1km, lat_1km, area_def)
+
+    Parameters
+    ----------
+
+    the_data: ndarray or xarray Dataset
+       (band, row, col) cube or Dataset of (row, col) bands
+    lons, lats: ndarray
+       swath longitudes and latitudes
+    area_def: pyresample AreaDefinition
+       target grid, e.g. area_def_from_dict(make_areadef_dict(...))
+
+    Returns
+    -------
+
+    band_ds: xarray Dataset
+       see SwathResampler.resample_bands
+    """
+    resampler = SwathResampler(lons, lats, area_def, radius_of_influence=radius_of_influence,
+                               nprocs=nprocs, cache_dir=cache_dir, method=method,
+                               **method_kwargs)
+    return resampler.resample_bands(the_data, band_names=band_names, input_fill=input_fill,
+                                    fill_value=fill_value)
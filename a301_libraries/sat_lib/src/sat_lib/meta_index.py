@@ -0,0 +1,322 @@
+"""
+  granule metadata index
+  ______________________
+
+  keep the parseMeta fields (corners, start/stop time, orbit, daynight,
+  product) for every MODIS hdf4 file under a directory in a sqlite
+  database, so that finding the granules that cover a region and time is
+  a query instead of opening every file.  Each row stores the file mtime,
+  and rebuilding the index only re-reads new or changed files.
+
+  to run from the command line::
+
+    meta_index build /data/modis --db modis_index.sqlite --nprocs 16
+
+    meta_index query --db modis_index.sqlite --bbox -130 45 -120 55 \\
+        --start 2013-08-10 --end 2013-08-11 --daynight Day
+
+  or from python::
+
+    update_index("modis_index.sqlite", "/data/modis")
+    rows = query_index("modis_index.sqlite", bbox=(-130, 45, -120, 55),
+                       time_range=("2013-08-10", "2013-08-11"))
+"""
+import json
+import os
+import sqlite3
+from importlib.metadata import version, PackageNotFoundError
+from pathlib import Path
+
+import click
+import numpy as np
+
+from .modismeta_read import parseMeta
+from .parallel import map_files
+
+try:
+    __version__ = version("sat_lib")
+except PackageNotFoundError:
+    __version__ = "unknown version"
+
+#
+# granule rows; times are iso strings with microseconds so they sort
+# and compare as text
+#
+_SCHEMA = """
+create table if not exists granules (
+    path text primary key,
+    mtime real not null,
+    filename text,
+    product text,
+    orbit integer,
+    daynight text,
+    start_time text,
+    stop_time text,
+    min_lat real,
+    max_lat real,
+    min_lon real,
+    max_lon real,
+    lon_0 real,
+    lat_0 real,
+    lon_list text,
+    lat_list text
+);
+create index if not exists granules_time on granules (start_time, stop_time);
+create index if not exists granules_lat on granules (min_lat, max_lat);
+"""
+
+_COLUMNS = ["path", "mtime", "filename", "product", "orbit", "daynight",
+            "start_time", "stop_time", "min_lat", "max_lat", "min_lon", "max_lon",
+            "lon_0", "lat_0", "lon_list", "lat_list"]
+
+
+def _iso_time(the_time):
+    """
+    normalize a date or datetime (str, datetime or datetime64) to the iso
+    string stored in the index
+    """
+    return str(np.datetime64(the_time, "us"))
+
+
+def open_index(db_path):
+    """
+    open (creating if needed) a granule index
+
+    Parameters
+    ----------
+
+    db_path: str or Path object
+       sqlite file
+
+    Returns
+    -------
+
+    conn: sqlite3.Connection
+       rows are returned as sqlite3.Row objects
+    """
+    conn = sqlite3.connect(str(db_path))
+    conn.row_factory = sqlite3.Row
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def granule_row(filename):
+    """
+    read the CoreMetadata.0 attribute of one file and return its index row
+
+    Parameters
+    ----------
+
+    filename: str or Path object
+       MODIS hdf4 file
+
+    Returns
+    -------
+
+    row: dict
+       column name -> value, see _COLUMNS
+    """
+    the_path = Path(filename).resolve()
+    mtime = the_path.stat().st_mtime
+    meta = parseMeta(the_path)
+    row = dict(
+        path=str(the_path),
+        mtime=mtime,
+        filename=meta["filename"],
+        product=meta["type"]["SHORTNAME"]["VALUE"],
+        orbit=int(meta["orbit"]),
+        daynight=meta["daynight"],
+        start_time=_iso_time(f"{meta['startdate']}T{meta['starttime']}"),
+        stop_time=_iso_time(f"{meta['stopdate']}T{meta['stoptime']}"),
+        min_lat=float(meta["min_lat"]),
+        max_lat=float(meta["max_lat"]),
+        min_lon=float(meta["min_lon"]),
+        max_lon=float(meta["max_lon"]),
+        lon_0=float(meta["lon_0"]),
+        lat_0=float(meta["lat_0"]),
+        lon_list=json.dumps([float(lon) for lon in meta["lon_list"]]),
+        lat_list=json.dumps([float(lat) for lat in meta["lat_list"]]),
+    )
+    return row
+
+
+def update_index(db_path, directory, pattern="*.hdf", nprocs=None, progress=False):
+    """
+    add new or modified granules under directory to the index and drop
+    rows for files that are gone.  Files whose mtime matches the index
+    are not reopened
+
+    Parameters
+    ----------
+
+    db_path: str or Path object
+       sqlite file, created if missing
+    directory: str or Path object
+       searched recursively for pattern
+    pattern: str
+       glob pattern for granule files
+    nprocs: int or None
+       number of worker processes, defaults to os.cpu_count()
+    progress: bool
+       print a line as each file is read
+
+    Returns
+    -------
+
+    (counts, errors): dict, dict
+       counts has the number of files added, unchanged and removed;
+       errors maps each unreadable file to its traceback
+    """
+    directory = Path(directory).resolve()
+    on_disk = {str(the_file.resolve()): the_file.stat().st_mtime
+               for the_file in directory.rglob(pattern) if the_file.is_file()}
+    conn = open_index(db_path)
+    prefix = os.path.join(str(directory), "")
+    indexed = {row["path"]: row["mtime"] for row in
+               conn.execute("select path, mtime from granules where substr(path, 1, ?) = ?",
+                            (len(prefix), prefix))}
+    stale = [path for path in indexed if path not in on_disk]
+    to_read = sorted(path for path, mtime in on_disk.items() if indexed.get(path) != mtime)
+    errors = {}
+    added = 0
+    insert = (f"insert or replace into granules ({', '.join(_COLUMNS)}) "
+              f"values ({', '.join('?'*len(_COLUMNS))})")
+    try:
+        with conn:
+            conn.executemany("delete from granules where path = ?",
+                             [(path,) for path in stale])
+        for count, (filename, row, error) in enumerate(
+                map_files(granule_row, to_read, nprocs=nprocs), start=1):
+            if error is None:
+                conn.execute(insert, [row[column] for column in _COLUMNS])
+                added += 1
+            else:
+                errors[filename] = error
+            if count % 1000 == 0:
+                conn.commit()
+            if progress:
+                status = "ok" if error is None else "FAILED"
+                print(f"[{count}/{len(to_read)}] {status} {Path(filename).name}")
+        conn.commit()
+    finally:
+        conn.close()
+    counts = dict(added=added, unchanged=len(on_disk) - len(to_read), removed=len(stale))
+    return counts, errors
+
+
+def query_index(db_path, bbox=None, time_range=None, daynight=None, product=None):
+    """
+    find the granules in the index that overlap a lon/lat box and time range
+
+    the overlap test uses the min/max of the corner longitudes and
+    latitudes, so granules that cross the antimeridian match any longitude
+
+    Parameters
+    ----------
+
+    db_path: str or Path object
+       sqlite file written by update_index
+    bbox: tuple or None
+       (west, south, east, north) in degrees; west > east is a box
+       that crosses the antimeridian
+    time_range: tuple or None
+       (start, end) as iso strings, datetimes or datetime64
+    daynight: str or None
+       'Day' or 'Night'
+    product: str or None
+       short name such as 'MYD021KM'
+
+    Returns
+    -------
+
+    rows: list of dicts
+       one per granule in start time order, with lon_list and lat_list
+       decoded to lists
+    """
+    clauses, params = [], []
+    if bbox is not None:
+        west, south, east, north = bbox
+        if west <= east:
+            clauses.append("max_lat >= ? and min_lat <= ? and max_lon >= ? and min_lon <= ?")
+        else:
+            #
+            # the box crosses the antimeridian
+            #
+            clauses.append("max_lat >= ? and min_lat <= ? and (max_lon >= ? or min_lon <= ?)")
+        params.extend([south, north, west, east])
+    if time_range is not None:
+        start, end = time_range
+        clauses.append("stop_time >= ? and start_time <= ?")
+        params.extend([_iso_time(start), _iso_time(end)])
+    if daynight is not None:
+        clauses.append("daynight = ?")
+        params.append(daynight)
+    if product is not None:
+        clauses.append("product = ?")
+        params.append(product)
+    where = f"where {' and '.join(clauses)}" if clauses else ""
+    conn = open_index(db_path)
+    try:
+        result = conn.execute(f"select * from granules {where} order by start_time", params)
+        rows = []
+        for row in result:
+            row = dict(row)
+            row["lon_list"] = json.loads(row["lon_list"])
+            row["lat_list"] = json.loads(row["lat_list"])
+            rows.append(row)
+    finally:
+        conn.close()
+    return rows
+
+
+@click.group()
+@click.version_option(__version__)
+def main():
+    """
+    build and query a sqlite index of MODIS granule metadata
+    """
+
+
+@main.command()
+@click.argument('directory', type=str, nargs=1)
+@click.option('--db', 'db_path', type=str, default="meta_index.sqlite",
+              help="sqlite index file")
+@click.option('--pattern', '-p', type=str, default="*.hdf",
+              help="glob pattern for granule files")
+@click.option('--nprocs', '-n', type=int, default=None,
+              help="number of worker processes (default: all cores)")
+def build(directory, db_path, pattern, nprocs):
+    """
+    add new or changed granules under DIRECTORY to the index
+    """
+    counts, errors = update_index(db_path, directory, pattern=pattern, nprocs=nprocs)
+    for filename, error in errors.items():
+        print(f"\nerror reading {filename}:\n{error}")
+    print(f"{db_path}: {counts['added']} added, {counts['unchanged']} unchanged, "
+          f"{counts['removed']} removed, {len(errors)} failed")
+    if errors:
+        raise SystemExit(1)
+
+
+@main.command()
+@click.option('--db', 'db_path', type=str, default="meta_index.sqlite",
+              help="sqlite index file")
+@click.option('--bbox', type=float, nargs=4, default=None,
+              help="west south east north in degrees")
+@click.option('--start', type=str, default=None, help="start date or time (iso)")
+@click.option('--end', type=str, default=None, help="end date or time (iso)")
+@click.option('--daynight', type=click.Choice(['Day', 'Night']), default=None)
+@click.option('--product', type=str, default=None, help="short name, e.g. MYD021KM")
+def query(db_path, bbox, start, end, daynight, product):
+    """
+    print the path of every indexed granule that matches, in time order
+    """
+    if not Path(db_path).is_file():
+        raise click.UsageError(f"no index at {db_path}, run meta_index build first")
+    time_range = None
+    if start is not None or end is not None:
+        time_range = (start or "0001-01-01", end or "9999-12-31")
+    rows = query_index(db_path, bbox=bbox, time_range=time_range,
+                       daynight=daynight, product=product)
+    for row in rows:
+        print(row["path"])
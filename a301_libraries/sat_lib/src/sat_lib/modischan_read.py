@@ -4,10 +4,20 @@ ______________________________
 """
 from pyhdf.SD import SD, SDC
 import pyhdf
+import logging
 import numpy as np
 from pathlib import Path
+#
+# xarray is imported inside read_modis_bands, so readband_lw and
+# read_plainvar don't pay for it
+#
+from .modis_chans import modischan_dict
+from .timing import timed
 
-def readband_lw(the_file, the_band):
+logger = logging.getLogger(__name__)
+
+def readband_lw(the_file, the_band, float32=False, out=None,
+                window=None, bbox=None, stride=1, geo_file=None):
     """
     read and calibrate a MODIS L1B longwave band from the 
      path to the hdf4 file
@@ -19,30 +29,443 @@ def readband_lw(the_file, the_band):
            path to the hdf4 file
        the_band: int
            band number for MODIS (20-36)
+       float32: bool
+           if True calibrate in float32 and set the _FillValue and counts
+           outside valid_range to np.nan
+       out: ndarray or None
+           preallocated float32 (row, col) array for the result, implies
+           float32=True
+       window: tuple or None
+           (row_start, row_stop, col_start, col_stop) pixel window to read
+       bbox: tuple or None
+           (west, south, east, north) in degrees, converted to a window
+           with bbox_to_window
+       stride: int
+           read every stride'th row and column of the window
+       geo_file: str or Path or None
+           file with the 5 km Latitude/Longitude used for bbox, defaults
+           to the_file
            
     Returns
     -------
        the_chan_calibrated: ndarray
            the pixel radiances in W/m^2/sr/micron
     """
-    sd_file = sd_open_file(the_file)
+    with timed("open"):
+        sd_file = sd_open_file(the_file)
     longwave_data = sd_file.select("EV_1KM_Emissive")  # select sds
     longwave_bands = sd_file.select("Band_1KM_Emissive")
-    band_nums = longwave_bands.get()
-    thechan_index = int(np.searchsorted(band_nums, the_band))
-    print(f"channel index for band {the_band} is {thechan_index}")
-    thechan_data = longwave_data[thechan_index, :, :]
-    scales = longwave_data.attributes()["radiance_scales"]
-    offsets = longwave_data.attributes()["radiance_offsets"]
+    with timed("attribute read"):
+        band_nums = longwave_bands.get()
+        thechan_index = int(np.searchsorted(band_nums, the_band))
+        attributes = longwave_data.attributes()
+        scales = attributes["radiance_scales"]
+        offsets = attributes["radiance_offsets"]
+    logger.debug("channel index for band %s is %d", the_band, thechan_index)
+    window = resolve_window(the_file, longwave_data.info()[2][1:], window=window,
+                            bbox=bbox, geo_file=geo_file)
+    with timed("sds read") as record:
+        thechan_data = read_window(longwave_data, window, stride, band_index=thechan_index)
+        record["nbytes"] = thechan_data.nbytes
     thechan_scale = scales[thechan_index]
     thechan_offset = offsets[thechan_index]
-    thechan_calibrated = (thechan_data - thechan_offset) * thechan_scale
-    print(f"f{thechan_offset=}, {thechan_scale=}")
+    with timed("scaling"):
+        if float32 or out is not None:
+            thechan_calibrated = calibrate_slab(thechan_data, thechan_scale, thechan_offset,
+                                                attributes.get("_FillValue"),
+                                                attributes.get("valid_range"), out=out)
+        else:
+            thechan_calibrated = (thechan_data - thechan_offset) * thechan_scale
+    logger.debug("thechan_offset=%s, thechan_scale=%s", thechan_offset, thechan_scale)
     sd_file.end()
     return thechan_calibrated
 
 
-def readband_wv(the_file, band_name):
+def bbox_to_window(geo_file, bbox, sds_shape):
+    """
+    find the pixel window of a MODIS granule that covers a lat/lon box,
+    using the 5 km Latitude/Longitude and scaling the 5 km rows and
+    columns to the resolution of the field being read
+
+    Parameters
+    ----------
+
+       geo_file: str or Path
+           hdf4 file with 5 km Latitude and Longitude (MYD021KM, MYD05_L2 ...)
+       bbox: tuple
+           (west, south, east, north) in degrees, west > east crosses
+           the antimeridian
+       sds_shape: tuple
+           (rows, cols) of the field the window is for
+
+    Returns
+    -------
+       window: tuple
+           (row_start, row_stop, col_start, col_stop), padded by one 5 km
+           pixel on each side and clipped to sds_shape
+    """
+    west, south, east, north = bbox
+    lats = read_plainvar(geo_file, 'Latitude')
+    lons = read_plainvar(geo_file, 'Longitude')
+    if west <= east:
+        lon_hit = np.logical_and(lons >= west, lons <= east)
+    else:
+        lon_hit = np.logical_or(lons >= west, lons <= east)
+    inside = lon_hit & np.logical_and(lats >= south, lats <= north)
+    rows, cols = np.nonzero(inside)
+    if len(rows) == 0:
+        raise ValueError(f"no pixels in {bbox=} for {geo_file}")
+    nrows, ncols = sds_shape
+    row_factor = max(1, int(round(nrows/lats.shape[0])))
+    col_factor = max(1, int(round(ncols/lats.shape[1])))
+    row_start = max(0, (rows.min() - 1)*row_factor)
+    row_stop = min(nrows, (rows.max() + 2)*row_factor)
+    col_start = max(0, (cols.min() - 1)*col_factor)
+    col_stop = min(ncols, (cols.max() + 2)*col_factor)
+    return int(row_start), int(row_stop), int(col_start), int(col_stop)
+
+
+def resolve_window(the_file, sds_shape, window=None, bbox=None, geo_file=None):
+    """
+    return the (row_start, row_stop, col_start, col_stop) window for a
+    field with 2-D shape sds_shape, from either a pixel window or a
+    lat/lon bbox, or None to read everything
+    """
+    if window is not None and bbox is not None:
+        raise ValueError("give either window or bbox, not both")
+    if bbox is not None:
+        if geo_file is None:
+            geo_file = the_file
+        window = bbox_to_window(geo_file, bbox, sds_shape)
+    if window is None:
+        return None
+    row_start, row_stop, col_start, col_stop = window
+    row_start, row_stop, _ = slice(row_start, row_stop).indices(sds_shape[0])
+    col_start, col_stop, _ = slice(col_start, col_stop).indices(sds_shape[1])
+    return row_start, row_stop, col_start, col_stop
+
+
+def read_window(sd_var, window=None, stride=1, band_index=None):
+    """
+    read a (row, col) hyperslab from a 2-D SDS, or from one band plane of
+    a (band, row, col) SDS, with SDS.get(start, count, stride)
+
+    Parameters
+    ----------
+
+       sd_var: pyhdf SDS
+           selected field
+       window: tuple or None
+           (row_start, row_stop, col_start, col_stop), None for all pixels
+       stride: int
+           step between rows and between columns
+       band_index: int or None
+           band plane to read from a 3-D field
+
+    Returns
+    -------
+       var_array: ndarray
+           (rows, cols) values
+    """
+    name, rank, dims, the_type, nattrs = sd_var.info()
+    nrows, ncols = dims[-2:]
+    if window is None:
+        window = (0, nrows, 0, ncols)
+    row_start, row_stop, col_start, col_stop = window
+    count = [len(range(row_start, row_stop, stride)),
+             len(range(col_start, col_stop, stride))]
+    if rank == 3:
+        var_array = sd_var.get(start=[band_index, row_start, col_start],
+                               count=[1] + count, stride=[1, stride, stride])
+    elif rank == 2:
+        var_array = sd_var.get(start=[row_start, col_start], count=count,
+                               stride=[stride, stride])
+    else:
+        raise ValueError(f"can't read a row/col window from {name} with {rank=}")
+    return var_array.reshape(count)
+
+
+def group_bands(bands):
+    """
+    group MODIS band names by the L1B field that stores them
+
+    Parameters
+    ----------
+
+       bands: list of int or str
+           band names from modischan_dict, e.g. [1, 4, 3, 31, '13hi']
+
+    Returns
+    -------
+       field_dict: dict
+           field_name -> list of (band_name, index) tuples sorted by index
+    """
+    field_dict = {}
+    for the_band in bands:
+        band_name = str(the_band)
+        if band_name not in modischan_dict:
+            raise KeyError(f"no MODIS band {band_name} in modischan_dict")
+        chan_info = modischan_dict[band_name]
+        band_list = field_dict.setdefault(chan_info["field_name"], [])
+        if (band_name, chan_info["index"]) not in band_list:
+            band_list.append((band_name, chan_info["index"]))
+    for band_list in field_dict.values():
+        band_list.sort(key=lambda item: item[1])
+    return field_dict
+
+
+def read_band_slab(sd_var, indices, window=None, stride=1):
+    """
+    read the band planes in indices from a (band, row, col) SDS, with one
+    SDS.get hyperslab per run of consecutive indices
+
+    Parameters
+    ----------
+
+       sd_var: pyhdf SDS
+           selected 3-D L1B field, e.g. EV_1KM_Emissive
+       indices: list of int
+           sorted band indices within the field
+       window: tuple or None
+           (row_start, row_stop, col_start, col_stop), None for all pixels
+       stride: int
+           step between rows and between columns
+
+    Returns
+    -------
+       slab: ndarray
+           raw counts with shape (len(indices), rows, cols)
+    """
+    name, rank, dims, the_type, nattrs = sd_var.info()
+    nbands, nrows, ncols = dims
+    if window is None:
+        window = (0, nrows, 0, ncols)
+    row_start, row_stop, col_start, col_stop = window
+    count = [len(range(row_start, row_stop, stride)),
+             len(range(col_start, col_stop, stride))]
+    runs = []
+    for index in indices:
+        if runs and index == runs[-1][1]:
+            runs[-1][1] = index + 1
+        else:
+            runs.append([index, index + 1])
+    slabs = [sd_var.get(start=[first, row_start, col_start], count=[stop - first] + count,
+                        stride=[1, stride, stride]).reshape([stop - first] + count)
+             for first, stop in runs]
+    if len(slabs) == 1:
+        return slabs[0]
+    return np.concatenate(slabs, axis=0)
+
+
+def invalid_counts(counts, fill_value=None, valid_range=None):
+    """
+    boolean mask that is True where counts equal the fill value or fall
+    outside valid_range (MODIS saturation and other flag values)
+
+    Parameters
+    ----------
+
+       counts: ndarray
+           raw integer values from an SDS
+       fill_value: int or None
+           the field's _FillValue
+       valid_range: sequence or None
+           [min, max] valid counts
+
+    Returns
+    -------
+       invalid: ndarray or None
+           bool mask, or None if neither check applies
+    """
+    invalid = None
+    if fill_value is not None:
+        invalid = (counts == fill_value)
+    if valid_range is not None:
+        out_of_range = np.logical_or(counts < valid_range[0], counts > valid_range[1])
+        invalid = out_of_range if invalid is None else np.logical_or(invalid, out_of_range,
+                                                                     out=invalid)
+    return invalid
+
+
+def calibrate_slab(slab, scales, offsets, fill_value=None, valid_range=None, out=None):
+    """
+    compute (counts - offset)*scale in float32 for a (row, col) band or
+    every plane of a (band, row, col) slab, setting fill values and counts
+    outside valid_range to np.nan in the same pass
+
+    Parameters
+    ----------
+
+       slab: ndarray
+           raw uint16 counts, (row, col) or (band, row, col)
+       scales, offsets: float or ndarray
+           one value, or one value per band plane
+       fill_value: int or None
+           the field's _FillValue
+       valid_range: sequence or None
+           [min, max] valid counts
+       out: ndarray or None
+           preallocated float32 array with the shape of slab that
+           receives the result, so a buffer can be reused between granules
+
+    Returns
+    -------
+       calibrated: ndarray
+           float32 array with the same shape as slab (out if given)
+    """
+    if out is None:
+        out = np.empty(slab.shape, dtype=np.float32)
+    elif out.dtype != np.float32 or out.shape != slab.shape:
+        raise ValueError(f"out needs dtype float32 and shape {slab.shape}, "
+                         f"got {out.dtype} {out.shape}")
+    scales = np.asarray(scales, dtype=np.float32)
+    offsets = np.asarray(offsets, dtype=np.float32)
+    if scales.ndim > 0:
+        plane_shape = (-1,) + (1,)*(slab.ndim - 1)
+        scales = scales.reshape(plane_shape)
+        offsets = offsets.reshape(plane_shape)
+    np.subtract(slab, offsets, out=out)
+    np.multiply(out, scales, out=out)
+    invalid = invalid_counts(slab, fill_value, valid_range)
+    if invalid is not None:
+        np.copyto(out, np.nan, where=invalid)
+    return out
+
+
+def read_modis_bands(the_file, bands, quantity=None, out=None,
+                     window=None, bbox=None, stride=1, geo_file=None):
+    """
+    read and calibrate several MODIS L1B bands from one hdf4 file.  Bands
+    are grouped by field using modischan_dict, each field is read with
+    one hyperslab per run of neighbouring bands, and each band is
+    calibrated straight into one float32 (band, row, col) array
+
+    Parameters
+    ----------
+
+       the_file: str or Path
+           path to the hdf4 file
+       bands: list of int or str
+           band names from modischan_dict, e.g. [29, 31, 32]
+       quantity: str or None
+           None uses the scale in modischan_dict (radiance for emissive
+           bands, reflectance for reflective bands), "radiance" returns
+           radiances for reflective bands too
+       out: ndarray or None
+           preallocated float32 (band, row, col) array, bands in the
+           requested order, that receives the calibrated values
+       window: tuple or None
+           (row_start, row_stop, col_start, col_stop) pixel window to read
+       bbox: tuple or None
+           (west, south, east, north) in degrees, converted to a window
+           with bbox_to_window
+       stride: int
+           read every stride'th row and column of the window
+       geo_file: str or Path or None
+           file with the 5 km Latitude/Longitude used for bbox, defaults
+           to the_file
+
+    Returns
+    -------
+       band_ds: xarray Dataset
+           one (row, col) float32 DataArray per band, named ch{band}, with
+           the field_name, wavelength_um and units as attributes.  Fill
+           values and counts outside valid_range are np.nan.  The bands
+           are views into one float32 (band, row, col) array
+    """
+    from xarray import DataArray, Dataset
+    if quantity not in (None, "radiance", "reflectance"):
+        raise ValueError(f"{quantity=} should be None, 'radiance' or 'reflectance'")
+    field_dict = group_bands(bands)
+    band_order = list(dict.fromkeys(str(the_band) for the_band in bands))
+    with timed("open"):
+        sd_file = sd_open_file(the_file)
+    cube = out
+    var_dict = {}
+    for field_name, band_list in field_dict.items():
+        sd_var = sd_file.select(field_name)
+        chan_info = modischan_dict[band_list[0][0]]
+        indices = [index for band_name, index in band_list]
+        scale_name, offset_name = chan_info["scale"], chan_info["offset"]
+        if quantity is not None and not scale_name.startswith(quantity):
+            if quantity == "reflectance":
+                raise ValueError(f"{field_name} has no reflectance calibration")
+            scale_name, offset_name = "radiance_scales", "radiance_offsets"
+        with timed("attribute read"):
+            attributes = sd_var.attributes()
+            scales = np.array(attributes[scale_name])[indices]
+            offsets = np.array(attributes[offset_name])[indices]
+            fill_value = attributes.get("_FillValue")
+            valid_range = attributes.get("valid_range")
+            if scale_name == "radiance_scales":
+                units = attributes.get("radiance_units", chan_info["units"])
+            else:
+                units = "none"
+        #
+        # all the 1 km fields share a grid, so resolve the bbox once
+        #
+        window = resolve_window(the_file, sd_var.info()[2][1:], window=window,
+                                bbox=bbox, geo_file=geo_file)
+        bbox = None
+        with timed("sds read") as record:
+            slab = read_band_slab(sd_var, indices, window, stride)
+            record["nbytes"] = slab.nbytes
+        sd_var.endaccess()
+        if cube is None:
+            cube = np.empty((len(band_order),) + slab.shape[1:], dtype=np.float32)
+        for plane, (band_name, index) in enumerate(band_list):
+            position = band_order.index(band_name)
+            with timed("scaling"):
+                calibrate_slab(slab[plane], scales[plane], offsets[plane],
+                               fill_value, valid_range, out=cube[position])
+            chan_info = modischan_dict[band_name]
+            attrs = dict(field_name=field_name, band=band_name,
+                         wavelength_um=chan_info["wavelength_um"],
+                         quantity=scale_name.split("_")[0], units=units)
+            var_dict[f"ch{band_name}"] = DataArray(cube[position],
+                                                   dims=["row", "col"], attrs=attrs)
+    sd_file.end()
+    #
+    # keep the order the bands were requested in
+    #
+    var_dict = {f"ch{band_name}": var_dict[f"ch{band_name}"] for band_name in band_order}
+    with timed("dataset build"):
+        band_ds = Dataset(data_vars=var_dict, attrs=dict(filename=str(the_file)))
+    return band_ds
+
+
+def read_reflective_bands(the_file, bands=None, quantity="reflectance"):
+    """
+    read and calibrate the MODIS L1B reflective solar bands (1-19 and 26,
+    including 13hi/13lo and 14hi/14lo) as reflectance or radiance
+
+    Parameters
+    ----------
+
+       the_file: str or Path
+           path to the hdf4 file
+       bands: list of int or str or None
+           reflective band names from modischan_dict, default is all of them
+       quantity: str
+           "reflectance" (unitless) or "radiance" (W/m^2/sr/micron)
+
+    Returns
+    -------
+       band_ds: xarray Dataset
+           see read_modis_bands
+    """
+    reflective = [band_name for band_name, chan_info in modischan_dict.items()
+                  if chan_info["field_name"].endswith("RefSB")]
+    if bands is None:
+        bands = reflective
+    not_reflective = [the_band for the_band in bands if str(the_band) not in reflective]
+    if not_reflective:
+        raise ValueError(f"{not_reflective} are not reflective solar bands")
+    return read_modis_bands(the_file, bands, quantity=quantity)
+
+
+def readband_wv(the_file, band_name, float32=False, out=None,
+                window=None, bbox=None, stride=1, geo_file=None):
     """
     see: https://atmosphere-imager.gsfc.nasa.gov/sites/default/files/ModAtmo/MYD05_L2.C6.CDL.fs
        for file format
@@ -56,6 +479,21 @@ def readband_wv(the_file, band_name):
            path to the hdf file
        band_name: str
            either 'Water_Vapor_Near_Infrared` or `Water_Vapor_Infrared` 
+       float32: bool
+           if True calibrate straight from int16 into float32, also
+           setting values outside valid_range to np.nan
+       out: ndarray or None
+           preallocated float32 array for the result, implies float32=True
+       window: tuple or None
+           (row_start, row_stop, col_start, col_stop) pixel window to read
+       bbox: tuple or None
+           (west, south, east, north) in degrees, converted to a window
+           with bbox_to_window
+       stride: int
+           read every stride'th row and column of the window
+       geo_file: str or Path or None
+           file with the 5 km Latitude/Longitude used for bbox, defaults
+           to the_file
            
     Returns
     -------
@@ -64,14 +502,26 @@ def readband_wv(the_file, band_name):
     """
     sd_file = sd_open_file(the_file)
     wv_data = sd_file.select(band_name)  # select sds
-    wv_image = wv_data.get()
+    window = resolve_window(the_file, wv_data.info()[2], window=window,
+                            bbox=bbox, geo_file=geo_file)
+    wv_image = read_window(wv_data, window, stride)
+    attributes = wv_data.attributes()
+    wv_scale = attributes['scale_factor']
+    wv_offset = attributes['add_offset']
+    fill_value = attributes['_FillValue']
+    if float32 or out is not None:
+        if out is None:
+            out = np.empty(wv_image.shape, dtype=np.float32)
+        np.multiply(wv_image, np.float32(wv_scale), out=out)
+        out += np.float32(wv_offset)
+        invalid = invalid_counts(wv_image, fill_value, attributes.get('valid_range'))
+        np.copyto(out, np.nan, where=invalid)
+        sd_file.end()
+        return out
     #
     # convert from int16 to float64
     #
     wv_image = wv_image.astype('float64')
-    wv_scale = wv_data.attributes()['scale_factor']
-    wv_offset = wv_data.attributes()['add_offset']
-    fill_value = wv_data.attributes()['_FillValue']
     #
     # convert fill values = -9999 to np.nan
     #
@@ -80,7 +530,7 @@ def readband_wv(the_file, band_name):
     sd_file.end()
     return wv_calibrated
 
-def read_plainvar(the_file, the_var):
+def read_plainvar(the_file, the_var, window=None, bbox=None, stride=1, geo_file=None):
     """
     read a modis variable like latitude or longitude that doesn't require
     scaling or offset
@@ -92,6 +542,16 @@ def read_plainvar(the_file, the_var):
 
        the_var: str
            variable name to extract
+       window: tuple or None
+           (row_start, row_stop, col_start, col_stop) pixel window to read
+       bbox: tuple or None
+           (west, south, east, north) in degrees, converted to a window
+           with bbox_to_window
+       stride: int
+           read every stride'th row and column of the window
+       geo_file: str or Path or None
+           file with the 5 km Latitude/Longitude used for bbox, defaults
+           to the_file
            
     Returns
     -------
@@ -105,7 +565,12 @@ def read_plainvar(the_file, the_var):
     # [...] gets all the data, no matter how many
     # dimensions
     #
-    var_array = sd_var.get()[...]
+    if window is None and bbox is None and stride == 1:
+        var_array = sd_var.get()[...]
+    else:
+        window = resolve_window(the_file, sd_var.info()[2][-2:], window=window,
+                                bbox=bbox, geo_file=geo_file)
+        var_array = read_window(sd_var, window, stride)
     sd_file.end()
     return var_array
     
@@ -5,19 +5,39 @@
   get the  Level1b CoreMetata.0 string and extract
   a dictionary.
 
+  the meta_read command prints that dictionary for one file, or for many
+  files read in a process pool writes one record per line::
+
+    meta_read MYD021KM.A2013222.2105.061.2018050083532.hdf
+
+    meta_read "/data/modis/*.hdf" --format csv -o granules.csv
+
 """
 
 import click
+import csv
+import functools
+import json
 import pdb
 import pprint
+import re
 import sys
 import types
+from importlib.metadata import version, PackageNotFoundError
 from pathlib import Path
 
 import numpy as np
 from pyhdf.SD import SD
 from pyhdf.SD import SDC
 
+from .hdf4_catalog import find_granules
+from .parallel import map_files
+
+try:
+    __version__ = version("sat_lib")
+except PackageNotFoundError:
+    __version__ = "unknown version"
+
 def get_core(filename):
     """
     given the path to a Modis hdf4 file with a "CoreMetadata.0" attribute
@@ -31,39 +51,109 @@ def get_core(filename):
     return core_meta
 
 
-# from https://github.com/pytroll/satpy/blob/master/satpy/readers/modis_l1b.py
+#
+# one ODL statement: KEY = value, where value is a quoted string, a
+# parenthesized list (which may continue over several lines) or the rest
+# of the line.  A line holding only END stops the parse
+#
+_STATEMENT = re.compile(
+    r"""^[ \t]*(?:(?P<end>END)[ \t]*\r?$|(?P<key>\w+)[ \t]*=[ \t]*"""
+    r"""(?P<value>"[^"]*"|\((?:[^()"]|"[^"]*")*\)|[^\n]*))""",
+    re.MULTILINE,
+)
+_INT = re.compile(r"[-+]?(?:0|[1-9]\d*)")
+_FLOAT = re.compile(r"[-+]?(?:\d+\.\d*|\.\d+|\d+(?=[eE]))(?:[eE][-+]?\d+)?")
+_ELEMENT = re.compile(r'\s*("[^"]*"|[^,"]*?)\s*(,|$)')
+_NOT_LITERAL = object()
+
+
+def _convert_scalar(text):
+    """
+    convert one ODL scalar to str, int or float, or return _NOT_LITERAL
+    for a bare word
+    """
+    if len(text) > 1 and text[0] == '"' and text[-1] == '"':
+        return text[1:-1]
+    if _INT.fullmatch(text):
+        return int(text)
+    if _FLOAT.fullmatch(text):
+        return float(text)
+    return _NOT_LITERAL
+
+
+@functools.lru_cache(maxsize=4096)
+def _convert_value(text):
+    """
+    convert an ODL value to a python str, int, float or tuple, falling back
+    to the raw text for bare words or lists of bare words.  Cached, since
+    most values ("1", "Day", ...) repeat across granules
+    """
+    if text.startswith("(") and text.endswith(")"):
+        inner = text[1:-1]
+        if not inner.strip():
+            return ()
+        elements = []
+        trailing_comma = False
+        for match in _ELEMENT.finditer(inner):
+            element, separator = match.groups()
+            if not element:
+                if separator == ",":
+                    return text
+                break
+            elements.append(_convert_scalar(element))
+            trailing_comma = separator == ","
+            if match.end() == len(inner):
+                break
+        if not elements or any(item is _NOT_LITERAL for item in elements):
+            return text
+        if len(elements) == 1 and not trailing_comma:
+            return elements[0]
+        return tuple(elements)
+    value = _convert_scalar(text)
+    if value is _NOT_LITERAL:
+        return text
+    return value
+
+
 def read_mda(attribute):
-    lines = attribute.split("\n")
+    """
+    parse an ODL/PVL metadata string such as CoreMetadata.0 into nested
+    dicts, one per GROUP or OBJECT.  Quoted strings, integers, floats and
+    parenthesized lists (as tuples) are converted without eval, and any
+    other value is kept as a string.  CLASS and NUM_VAL are dropped
+
+    Parameters
+    ----------
+
+    attribute: str
+       the metadata string
+
+    Returns
+    -------
+
+    mda: dict
+       e.g. mda["INVENTORYMETADATA"]["ECSDATAGRANULE"]["DAYNIGHTFLAG"]["VALUE"]
+    """
     mda = {}
     current_dict = mda
     path = []
-    for line in lines:
-        if not line:
-            continue
-        if line.strip() == "END":
+    dict_stack = []
+    for match in _STATEMENT.finditer(attribute):
+        if match.group("end"):
             break
-        try:
-            key, val = line.split("=")
-        except ValueError:
-            continue
-        key = key.strip()
-        val = val.strip()
-        try:
-            val = eval(val)
-        except (NameError, SyntaxError, ValueError) as e:
-            pass
+        key = match.group("key")
+        val = _convert_value(match.group("value").rstrip())
         if key in ["GROUP", "OBJECT"]:
             new_dict = {}
             path.append(val)
+            dict_stack.append(current_dict)
             current_dict[val] = new_dict
             current_dict = new_dict
         elif key in ["END_GROUP", "END_OBJECT"]:
-            if val != path[-1]:
-                raise SyntaxError
-            path = path[:-1]
-            current_dict = mda
-            for item in path:
-                current_dict = current_dict[item]
+            if not path or val != path[-1]:
+                raise SyntaxError(f"{key} = {val} does not close {path[-1:]}")
+            path.pop()
+            current_dict = dict_stack.pop()
         elif key in ["CLASS", "NUM_VAL"]:
             pass
         else:
@@ -73,7 +163,6 @@ def read_mda(attribute):
 
 class metaParse:
     def __init__(self, metaDat):
-        import re
         self.metaDat = str(metaDat).rstrip(" \t\r\n\0")
         self.meta_dict = read_mda(self.metaDat)
         the_dict = self.meta_dict["INVENTORYMETADATA"]
@@ -212,24 +301,119 @@ def parseMeta(meta_source):
     return outDict
 
 
+def _jsonable(value):
+    """
+    convert numpy scalars and tuples in a parseMeta dict to plain python
+    so it can be written as json
+    """
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _meta_record(filename):
+    """
+    parseMeta output for one file as plain python, plus the file path
+    """
+    record = dict(path=str(filename))
+    record.update(_jsonable(parseMeta(filename)))
+    return record
+
+
+def _csv_row(record):
+    """
+    flatten a record for csv: the type and sensor groups are reduced to
+    their short names and the corner lists are written as json
+    """
+    row = {}
+    for key, value in record.items():
+        if key == "type":
+            row["product"] = value["SHORTNAME"]["VALUE"]
+        elif key == "sensor":
+            row["platform"] = value["ASSOCIATEDPLATFORMSHORTNAME"]["VALUE"]
+        elif isinstance(value, (list, dict)):
+            row[key] = json.dumps(value)
+        else:
+            row[key] = value
+    return row
+
+
+def iter_meta(filenames, nprocs=None):
+    """
+    run parseMeta on many files in a process pool, yielding results in
+    input order as they finish, see sat_lib.parallel.map_files
+
+    Parameters
+    ----------
+
+    filenames: list of str or Path objects
+       MODIS hdf4 files
+    nprocs: int or None
+       number of worker processes, defaults to os.cpu_count()
+
+    Yields
+    ------
+
+    (filename, record, error): Path, dict or None, str or None
+       record is the parseMeta dict plus the file path, with numpy values
+       converted to python; error is the traceback if the file failed
+    """
+    yield from map_files(_meta_record, filenames, nprocs=nprocs)
+
+
 @click.command()
-@click.argument('hdf_file',type=str,nargs=1)
-def main(hdf_file):
+@click.version_option(__version__)
+@click.argument('hdf_files', type=str, nargs=-1, required=True)
+@click.option('--format', '-f', 'out_format', type=click.Choice(['pprint', 'jsonl', 'csv']),
+              default=None, help="output format (default: pprint for one file, jsonl for many)")
+@click.option('--output', '-o', type=click.File('w'), default='-',
+              help="output file (default: stdout)")
+@click.option('--nprocs', '-n', type=int, default=None,
+              help="number of worker processes (default: all cores)")
+def main(hdf_files, out_format, output, nprocs):
     """
-    print the metadata dict
+    print the metadata dict for one or more hdf files
 
     Parameters
     ----------
 
-    hdf_file: path or str to hdf data
+    hdf_files: hdf files, directories or glob patterns
 
     Returns
     -------
 
-    side effect: printing the metadata dictionary
+    side effect: printing the metadata dictionaries, or writing them one
+    per line as json or csv
     """
-    hdf_path = Path(hdf_file).resolve()
-    out = parseMeta(hdf_path)
-    print(f"core metadata for {hdf_path}")
-    pprint.pprint(out)
-
+    filenames = find_granules(hdf_files)
+    if not filenames:
+        raise click.UsageError(f"no hdf files found in {hdf_files}")
+    if out_format is None:
+        out_format = "pprint" if len(filenames) == 1 else "jsonl"
+    writer = None
+    failed = 0
+    for filename, record, error in iter_meta(filenames, nprocs=nprocs):
+        if error is not None:
+            failed += 1
+            print(f"error reading {filename}: {error.strip().splitlines()[-1]}",
+                  file=sys.stderr)
+            continue
+        if out_format == "pprint":
+            print(f"core metadata for {filename}", file=output)
+            pprint.pprint(record, stream=output)
+        elif out_format == "jsonl":
+            output.write(json.dumps(record) + "\n")
+        else:
+            row = _csv_row(record)
+            if writer is None:
+                writer = csv.DictWriter(output, fieldnames=list(row.keys()),
+                                        extrasaction='ignore')
+                writer.writeheader()
+            writer.writerow(row)
+        output.flush()
+    if failed:
+        raise SystemExit(1)
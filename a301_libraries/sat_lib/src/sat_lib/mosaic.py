@@ -0,0 +1,353 @@
+"""
+  out-of-core swath mosaics
+  _________________________
+
+  MosaicBuilder resamples granules one at a time into a large target
+  grid that lives on disk as numpy memmaps, split into square tiles.
+  Each granule is resampled only onto the tiles it overlaps, and each
+  output pixel keeps the value from its best contributor so far
+  (closest to nadir, latest, or any score you supply).  Memory use is
+  one granule plus one tile, however many granules go into the mosaic
+
+  usage::
+
+      area_def = registry.get("canada_1km")
+      builder = MosaicBuilder(area_def, ["ch29", "ch31", "ch32"], "mosaic_dir")
+      for the_file in granules:
+          band_ds = read_modis_bands(the_file, [29, 31, 32])
+          lons, lats = read_geolocation_1km(the_file)
+          builder.add_granule(lons, lats, band_ds)
+      builder.to_netcdf("mosaic.nc")
+
+  or build_modis_mosaic(granules, [29, 31, 32], area_def, "mosaic_dir")
+"""
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+
+from .mapping import SwathResampler, swath_outline
+from .timing import timed
+
+logger = logging.getLogger(__name__)
+
+
+def nadir_score(swath_shape):
+    """
+    score that prefers pixels near the middle of the scan: minus the
+    distance in pixels from the center column
+
+    Parameters
+    ----------
+
+    swath_shape: tuple
+       (rows, cols) of the swath
+
+    Returns
+    -------
+
+    score: ndarray
+       float32 (rows, cols)
+    """
+    rows, cols = swath_shape
+    col_score = -np.abs(np.arange(cols, dtype=np.float32) - (cols - 1)/2.)
+    return np.broadcast_to(col_score, (rows, cols))
+
+
+class MosaicBuilder:
+    """
+    a disk-backed mosaic on area_def.  The band values, the score of the
+    granule each pixel came from and that granule's number are stored
+    as memmaps in out_dir, so a mosaic can be larger than memory and
+    built over several sessions
+
+    Parameters
+    ----------
+
+    area_def: pyresample AreaDefinition
+       target grid
+    band_names: list of str
+       names of the bands, in the order of the cubes passed to add_granule
+    out_dir: str or Path object
+       directory for bands.dat, score.dat, source.dat and mosaic.json.
+       An existing mosaic with the same grid and bands is reopened
+    tile_size: int
+       tile edge in pixels; each granule is resampled one tile at a time
+    radius_of_influence: float
+       largest distance in meters to a swath pixel
+    method: str
+       resampling method, see sat_lib.mapping.SwathResampler
+    """
+    def __init__(self, area_def, band_names, out_dir, tile_size=1024,
+                 radius_of_influence=5000, method="nearest"):
+        self.area_def = area_def
+        self.band_names = list(band_names)
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.tile_size = tile_size
+        self.radius_of_influence = radius_of_influence
+        self.method = method
+        shape = area_def.shape
+        info_path = self.out_dir / "mosaic.json"
+        info = dict(shape=list(shape), band_names=self.band_names,
+                    area_extent=[float(item) for item in area_def.area_extent],
+                    crs_wkt=area_def.crs.to_wkt(), granules=[])
+        mode = "w+"
+        if info_path.is_file():
+            with open(info_path, "r") as infile:
+                old_info = json.load(infile)
+            granules = old_info.pop("granules")
+            if old_info != {key: value for key, value in info.items() if key != "granules"}:
+                raise ValueError(f"{out_dir} holds a mosaic with a different grid or bands")
+            info["granules"] = granules
+            mode = "r+"
+        self.info = info
+        self.bands = np.memmap(self.out_dir / "bands.dat", dtype=np.float32, mode=mode,
+                               shape=(len(self.band_names),) + shape)
+        self.score = np.memmap(self.out_dir / "score.dat", dtype=np.float64, mode=mode,
+                               shape=shape)
+        self.source = np.memmap(self.out_dir / "source.dat", dtype=np.int32, mode=mode,
+                                shape=shape)
+        if mode == "w+":
+            for row_slice, col_slice in self.tiles():
+                self.bands[:, row_slice, col_slice] = np.nan
+                self.score[row_slice, col_slice] = -np.inf
+                self.source[row_slice, col_slice] = -1
+            self.flush()
+
+    @property
+    def granules(self):
+        """
+        labels of the granules added so far; source holds indices into
+        this list
+        """
+        return self.info["granules"]
+
+    def tiles(self, row_range=None, col_range=None):
+        """
+        (row_slice, col_slice) for every tile, or only the tiles that
+        overlap row_range and col_range ((start, stop) pixel ranges)
+        """
+        nrows, ncols = self.area_def.shape
+        row_start, row_stop = row_range if row_range is not None else (0, nrows)
+        col_start, col_stop = col_range if col_range is not None else (0, ncols)
+        tile = self.tile_size
+        for row in range(row_start//tile*tile, row_stop, tile):
+            for col in range(col_start//tile*tile, col_stop, tile):
+                yield slice(row, min(row + tile, nrows)), slice(col, min(col + tile, ncols))
+
+    def footprint(self, lons, lats, stride=10):
+        """
+        (row_range, col_range) of the target pixels a swath can reach,
+        from the sat_lib.mapping.swath_outline points, padded by
+        radius_of_influence.  None if the swath misses the grid
+        """
+        import pyproj
+        lon_points, lat_points = swath_outline(lons, lats, stride=stride)
+        x, y = pyproj.Proj(self.area_def.crs)(lon_points, lat_points)
+        good = np.isfinite(x) & np.isfinite(y)
+        if not good.any():
+            return None
+        ll_x, ll_y, ur_x, ur_y = self.area_def.area_extent
+        pad = self.radius_of_influence
+        col = (x[good] - ll_x)/self.area_def.pixel_size_x
+        row = (ur_y - y[good])/self.area_def.pixel_size_y
+        col_pad = pad/self.area_def.pixel_size_x
+        row_pad = pad/self.area_def.pixel_size_y
+        nrows, ncols = self.area_def.shape
+        row_range = (max(int(np.floor(row.min() - row_pad)), 0),
+                     min(int(np.ceil(row.max() + row_pad)), nrows))
+        col_range = (max(int(np.floor(col.min() - col_pad)), 0),
+                     min(int(np.ceil(col.max() + col_pad)), ncols))
+        if row_range[0] >= row_range[1] or col_range[0] >= col_range[1]:
+            return None
+        return row_range, col_range
+
+    def add_granule(self, lons, lats, the_data, score="nadir", time=None, label=None):
+        """
+        resample one granule onto the tiles it overlaps and keep, for each
+        pixel, whichever of the mosaic and the granule has the higher score
+
+        Parameters
+        ----------
+
+        lons, lats: ndarray
+           (row, col) swath geolocation
+        the_data: ndarray or xarray Dataset
+           (band, row, col) cube in band_names order, or a Dataset with a
+           (row, col) variable for each band name
+        score: "nadir", "latest" or ndarray
+           "nadir" prefers pixels near the center of the scan (see
+           nadir_score), "latest" prefers the granule with the latest
+           time, and a (row, col) array gives your own per-pixel score
+        time: str or datetime64 or None
+           granule time, needed for score="latest"
+        label: str or None
+           name recorded for the granule in mosaic.json
+
+        Returns
+        -------
+
+        npixels: int
+           number of mosaic pixels taken from this granule
+        """
+        lons, lats = np.asarray(lons), np.asarray(lats)
+        swath_shape = lons.shape
+        if hasattr(the_data, "data_vars"):
+            cube = np.stack([np.asarray(the_data[name].values, dtype=np.float32)
+                             for name in self.band_names])
+        else:
+            cube = np.asarray(the_data, dtype=np.float32)
+        if cube.shape != (len(self.band_names),) + swath_shape:
+            raise ValueError(f"{cube.shape=} should be {(len(self.band_names),) + swath_shape}")
+        if isinstance(score, str) and score == "nadir":
+            score = nadir_score(swath_shape)
+        elif isinstance(score, str) and score == "latest":
+            if time is None:
+                raise ValueError("score='latest' needs the granule time")
+            seconds = np.datetime64(time, "s").astype(np.int64)
+            score = np.full(swath_shape, seconds, dtype=np.float64)
+        score = np.asarray(score, dtype=np.float64)
+        granule_index = len(self.granules)
+        npixels = 0
+        extent = self.footprint(lons, lats)
+        if extent is None:
+            logger.debug("granule %s misses the mosaic", label)
+            return npixels
+        for row_slice, col_slice in self.tiles(*extent):
+            tile_area = self.area_def[row_slice, col_slice]
+            with timed("mosaic resample"):
+                resampler = SwathResampler(lons, lats, tile_area,
+                                           radius_of_influence=self.radius_of_influence,
+                                           persist=False, method=self.method)
+                if len(resampler.target_index) == 0:
+                    continue
+                #
+                # the score stays float64 so "latest" keeps whole seconds
+                #
+                tile_score = resampler.resample(score)
+                tile_cube = resampler.resample(cube)
+            with timed("mosaic merge"):
+                old_score = np.asarray(self.score[row_slice, col_slice])
+                better = np.isfinite(tile_score) & (tile_score > old_score)
+                if not better.any():
+                    continue
+                tile_bands = np.asarray(self.bands[:, row_slice, col_slice])
+                tile_bands[:, better] = tile_cube[:, better]
+                self.bands[:, row_slice, col_slice] = tile_bands
+                old_score[better] = tile_score[better]
+                self.score[row_slice, col_slice] = old_score
+                tile_source = np.asarray(self.source[row_slice, col_slice])
+                tile_source[better] = granule_index
+                self.source[row_slice, col_slice] = tile_source
+                npixels += int(better.sum())
+        self.granules.append(label if label is not None else f"granule_{granule_index}")
+        self.flush()
+        logger.debug("granule %s: %d mosaic pixels", label, npixels)
+        return npixels
+
+    def flush(self):
+        """
+        write the memmaps and mosaic.json to disk
+        """
+        self.bands.flush()
+        self.score.flush()
+        self.source.flush()
+        with open(self.out_dir / "mosaic.json", "w") as outfile:
+            json.dump(self.info, outfile, indent=4)
+
+    def to_dataset(self):
+        """
+        the mosaic as an xarray Dataset backed by dask arrays over the
+        memmaps (chunked by tile), with the same x/y and crs coordinates
+        as sat_lib.mapping.SwathResampler.resample_bands, plus the
+        source granule number of each pixel
+
+        Returns
+        -------
+
+        mosaic_ds: xarray Dataset
+           one (y, x) variable per band and "source" (-1 where empty);
+           attrs["granules"] lists the granule labels
+        """
+        import dask.array as da
+        import xarray
+        chunks = (self.tile_size, self.tile_size)
+        crs = self.area_def.crs
+        coords = dict(x=('x', self.area_def.projection_x_coords, dict(units='m')),
+                      y=('y', self.area_def.projection_y_coords, dict(units='m')),
+                      crs=((), 0, crs.to_cf()))
+        data_vars = {}
+        for index, name in enumerate(self.band_names):
+            data_vars[name] = (('y', 'x'), da.from_array(self.bands[index], chunks=chunks),
+                               dict(grid_mapping='crs'))
+        data_vars["source"] = (('y', 'x'), da.from_array(self.source, chunks=chunks),
+                               dict(grid_mapping='crs'))
+        attrs = dict(area_id=self.area_def.area_id,
+                     area_extent=[float(item) for item in self.area_def.area_extent],
+                     crs_wkt=crs.to_wkt(), granules=json.dumps(self.granules))
+        return xarray.Dataset(data_vars=data_vars, coords=coords, attrs=attrs)
+
+    def to_netcdf(self, filename):
+        """
+        write the mosaic to a compressed netcdf file one tile at a time
+        """
+        mosaic_ds = self.to_dataset()
+        encoding = {name: dict(zlib=True, complevel=4,
+                               chunksizes=(min(self.tile_size, mosaic_ds.sizes['y']),
+                                           min(self.tile_size, mosaic_ds.sizes['x'])))
+                    for name in list(self.band_names) + ["source"]}
+        mosaic_ds.to_netcdf(filename, encoding=encoding)
+
+
+def build_modis_mosaic(granules, bands, area_def, out_dir, quantity=None, score="nadir",
+                       tile_size=1024, radius_of_influence=5000, method="nearest"):
+    """
+    stream MODIS L1B granules into a MosaicBuilder, reading the bands with
+    read_modis_bands and the 1 km geolocation with read_geolocation_1km.
+    Granules that fail to read are logged and skipped
+
+    Parameters
+    ----------
+
+    granules: list of str or Path objects
+       MYD021KM/MOD021KM files
+    bands: list of int or str
+       band names from modischan_dict
+    area_def: pyresample AreaDefinition
+       mosaic grid, e.g. from sat_lib.mapping.GridRegistry
+    out_dir: str or Path object
+       mosaic directory, see MosaicBuilder
+    quantity: str or None
+       passed to read_modis_bands
+    score: "nadir" or "latest"
+       how to choose between overlapping granules; "latest" uses the
+       granule start time from parseMeta
+
+    Returns
+    -------
+
+    builder: MosaicBuilder
+    """
+    from .geo_interp import read_geolocation_1km
+    from .modischan_read import read_modis_bands
+    from .modismeta_read import parseMeta
+    band_names = [f"ch{the_band}" for the_band in bands]
+    builder = MosaicBuilder(area_def, band_names, out_dir, tile_size=tile_size,
+                            radius_of_influence=radius_of_influence, method=method)
+    for the_file in granules:
+        the_file = Path(the_file)
+        try:
+            with timed("mosaic read"):
+                band_ds = read_modis_bands(the_file, bands, quantity=quantity)
+                lons, lats = read_geolocation_1km(the_file)
+            time = None
+            if score == "latest":
+                meta = parseMeta(the_file)
+                time = f"{meta['startdate']}T{meta['starttime']}"
+        except Exception:
+            logger.exception("skipping %s", the_file)
+            continue
+        builder.add_granule(lons, lats, band_ds, score=score, time=time, label=the_file.name)
+    return builder
@@ -0,0 +1,73 @@
+"""
+  running a function over many files
+  __________________________________
+
+  pyhdf is not thread-safe, so the batch tools (meta_read, meta_index,
+  cloudsat_batch) read granules in a process pool.  map_files runs the
+  worker on each file and catches its exceptions, handing back the
+  traceback as text, so that one bad file is reported instead of stopping
+  the whole batch::
+
+    for filename, result, error in map_files(parseMeta, filenames, nprocs=8):
+        if error is not None:
+            print(f"error reading {filename}:\\n{error}")
+"""
+import functools
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def _safe_call(func, filename, **kwargs):
+    """
+    return (filename, func(filename, **kwargs), None), or
+    (filename, None, traceback text) if func raises
+    """
+    try:
+        return filename, func(filename, **kwargs), None
+    except Exception:
+        return filename, None, traceback.format_exc()
+
+
+def map_files(func, filenames, nprocs=None, ordered=True, **kwargs):
+    """
+    call func(filename, **kwargs) for every file, in a process pool if
+    nprocs > 1, yielding one result per file
+
+    Parameters
+    ----------
+
+    func: callable
+       module-level function (it is pickled to the workers)
+    filenames: list of str or Path objects
+       files to process
+    nprocs: int or None
+       number of worker processes, defaults to os.cpu_count(); with 1
+       the files are processed in this process
+    ordered: bool
+       yield in input order (files are handed out in chunks), or in the
+       order the files finish
+    kwargs: dict
+       extra keyword arguments for func
+
+    Yields
+    ------
+
+    (filename, result, error): filename, object or None, str or None
+       error is the traceback text if func raised
+    """
+    filenames = list(filenames)
+    worker = functools.partial(_safe_call, func, **kwargs)
+    if nprocs is None:
+        nprocs = os.cpu_count()
+    if nprocs == 1 or len(filenames) <= 1:
+        yield from map(worker, filenames)
+        return
+    with ProcessPoolExecutor(max_workers=nprocs) as pool:
+        if ordered:
+            chunksize = max(1, len(filenames)//(4*nprocs))
+            yield from pool.map(worker, filenames, chunksize=chunksize)
+        else:
+            futures = [pool.submit(worker, filename) for filename in filenames]
+            for future in as_completed(futures):
+                yield future.result()
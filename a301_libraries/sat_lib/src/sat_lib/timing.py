@@ -0,0 +1,96 @@
+"""
+  timing instrumentation
+  ______________________
+
+  the readers wrap each stage (open, attribute read, SDS read, scaling,
+  geodesic, Dataset build ...) in the timed context manager, which adds
+  the wall time and bytes read to a running total and logs a DEBUG
+  message to the "sat_lib" logger.  Nothing is printed unless you ask::
+
+    import logging
+    from sat_lib.timing import timing_report, reset_timing
+
+    logging.basicConfig(level=logging.DEBUG)   # optional: one line per stage
+    reset_timing()
+    ds = read_cloudsat_vars(['Radar_Reflectivity'], filename)
+    print(timing_report())
+"""
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("sat_lib")
+
+#
+# stage name -> dict(calls, seconds, nbytes)
+#
+_stage_totals = {}
+
+
+@contextmanager
+def timed(stage):
+    """
+    time the enclosed block and add it to the totals for stage
+
+    the context manager yields a dict; set its "nbytes" key to record
+    how many bytes the stage read::
+
+        with timed("sds read") as record:
+            var_vals = var_sd.get()
+            record["nbytes"] = var_vals.nbytes
+
+    Parameters
+    ----------
+
+    stage: str
+       stage name used in the report
+    """
+    record = {"nbytes": 0}
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        elapsed = time.perf_counter() - start
+        totals = _stage_totals.setdefault(stage, dict(calls=0, seconds=0., nbytes=0))
+        totals["calls"] += 1
+        totals["seconds"] += elapsed
+        totals["nbytes"] += record["nbytes"]
+        logger.debug("%s: %.4f s, %d bytes", stage, elapsed, record["nbytes"])
+
+
+def reset_timing():
+    """
+    clear the accumulated stage totals
+    """
+    _stage_totals.clear()
+
+
+def timing_summary():
+    """
+    return a copy of the stage totals
+
+    Returns
+    -------
+
+    summary: dict
+       stage name -> dict(calls, seconds, nbytes)
+    """
+    return {stage: dict(totals) for stage, totals in _stage_totals.items()}
+
+
+def timing_report():
+    """
+    return the stage totals as a table, slowest stage first
+
+    Returns
+    -------
+
+    report: str
+    """
+    lines = [f"{'stage':<24}{'calls':>8}{'seconds':>12}{'MB':>12}"]
+    stages = sorted(_stage_totals.items(), key=lambda item: item[1]["seconds"],
+                    reverse=True)
+    for stage, totals in stages:
+        lines.append(f"{stage:<24}{totals['calls']:>8d}{totals['seconds']:>12.4f}"
+                     f"{totals['nbytes']*1.e-6:>12.2f}")
+    return "\n".join(lines)
@@ -0,0 +1,86 @@
+"""
+  shared fixtures: a small synthetic cloudsat granule written with pyhdf
+"""
+import numpy as np
+import pytest
+
+NRAY, NBIN = 400, 125
+
+
+def write_cloudsat_granule(filename, nray=NRAY, nbin=NBIN, seed=0):
+    """
+    write a cloudsat-style hdf4 file: Geolocation Fields and Data Fields
+    vgroups with Vdata and SDS variables, and Swath Attributes with the
+    .missing and .factor values that scale_cloudsat_var uses
+    """
+    from pyhdf.HDF import HDF, HC
+    from pyhdf.SD import SD, SDC
+    import pyhdf.V
+    import pyhdf.VS
+    rng = np.random.default_rng(seed)
+    sd = SD(str(filename), SDC.WRITE | SDC.CREATE)
+    height = (np.arange(nbin)[::-1]*240 - 5000 + np.zeros((nray, 1))).astype(np.int16)
+    height += (np.arange(nray) % 7)[:, np.newaxis].astype(np.int16)
+    height[:20, :] = -9999
+    refl = rng.integers(-3000, 2000, (nray, nbin)).astype(np.int16)
+    refl[refl < -2800] = -8888
+    qr = rng.integers(-200, 200, (2, nray, nbin)).astype(np.int16)
+    qr[qr < -190] = -999
+    layertop = rng.integers(-100, 10000, (nray, 5)).astype(np.int16)
+    refs = {}
+    for name, values in [("Height", height), ("Radar_Reflectivity", refl), ("QR", qr),
+                         ("LayerTop", layertop)]:
+        sds = sd.create(name, SDC.INT16, values.shape)
+        sds[:] = values
+        refs[name] = sds.ref()
+        sds.endaccess()
+    sd.end()
+    hdf = HDF(str(filename), HC.WRITE)
+    vs = hdf.vstart()
+    v = hdf.vgstart()
+
+    def make_vdata(name, values, the_type):
+        vd = vs.create(name, ((name, the_type, 1),))
+        vd.write([[value] for value in np.asarray(values).tolist()])
+        ref = vd._refnum
+        vd.detach()
+        return ref
+
+    root = v.create('2B-GEOPROF')
+    geo = v.create('Geolocation Fields')
+    data = v.create('Data Fields')
+    attrs = v.create('Swath Attributes')
+    lons = (np.linspace(170, 190, nray) + 180) % 360 - 180
+    lats = np.linspace(-10, 60, nray)
+    for name, values, the_type in [("Longitude", lons, HC.FLOAT32),
+                                   ("Latitude", lats, HC.FLOAT32),
+                                   ("Profile_time", np.arange(nray)*0.16, HC.FLOAT32),
+                                   ("TAI_start", [4.6e8 + 0.123456], HC.FLOAT64)]:
+        geo.insert(vs.attach(make_vdata(name, values, the_type)))
+    data.insert(vs.attach(make_vdata("DEM_elevation", rng.integers(0, 3000, nray), HC.INT16)))
+    for name in refs:
+        data.add(HC.DFTAG_NDG, refs[name])
+    for name, value, the_type in [("granule_number", 1234, HC.INT32),
+                                  ("Height.missing", -9999, HC.INT16),
+                                  ("Radar_Reflectivity.missing", -8888, HC.INT16),
+                                  ("Radar_Reflectivity.factor", 100., HC.FLOAT32),
+                                  ("QR.missing", -999, HC.INT16),
+                                  ("FU.missing", -999, HC.INT16),
+                                  ("QR.factor", 100., HC.FLOAT32),
+                                  ("LayerTop.missing", -99, HC.INT16)]:
+        attrs.insert(vs.attach(make_vdata(name, [value], the_type)))
+    for group in (geo, data, attrs):
+        root.insert(group)
+    for group in (root, geo, data, attrs):
+        group.detach()
+    v.end()
+    vs.end()
+    hdf.close()
+    return filename
+
+
+@pytest.fixture(scope="session")
+def cloudsat_file(tmp_path_factory):
+    pytest.importorskip("pyhdf")
+    the_file = tmp_path_factory.mktemp("cloudsat") / "synthetic_CS_2B-GEOPROF.hdf"
+    return write_cloudsat_granule(the_file)
@@ -0,0 +1,60 @@
+"""
+  along_track_distance against the per-profile Geod.inv loop it replaced
+"""
+import numpy as np
+import pytest
+
+from sat_lib.cloudsat import along_track_distance
+
+pyproj = pytest.importorskip("pyproj")
+
+NPROFILES = 37_000
+
+
+def synthetic_track(nprofiles=NPROFILES):
+    """
+    one sun-synchronous-like orbit: latitude swings to +-82 degrees and
+    longitude drifts west across the antimeridian
+    """
+    phase = np.linspace(0., 2.*np.pi, nprofiles)
+    lats = 82.*np.sin(phase)
+    lons = (150. + np.degrees(phase) - 25.*phase + 180.) % 360. - 180.
+    return lons, lats
+
+
+def loop_distance(lons, lats):
+    """
+    the original get_geo loop: one Geod.inv call per profile
+    """
+    great_circle = pyproj.Geod(ellps='WGS84')
+    distance = [0]
+    for index in np.arange(1, len(lons)):
+        azi12, azi21, step = great_circle.inv(lons[index-1], lats[index-1],
+                                              lons[index], lats[index])
+        distance.append(distance[index-1] + step)
+    return np.array(distance)
+
+
+@pytest.fixture(scope="module")
+def track():
+    lons, lats = synthetic_track()
+    return lons, lats, loop_distance(lons, lats)
+
+
+def test_geodesic_matches_loop(track):
+    lons, lats, expected = track
+    distance = along_track_distance(lons, lats)
+    assert distance.shape == expected.shape
+    assert distance[0] == 0.
+    np.testing.assert_allclose(distance, expected, rtol=1.e-9, atol=1.e-6)
+
+
+def test_haversine_close_to_loop(track):
+    lons, lats, expected = track
+    distance = along_track_distance(lons, lats, method="haversine")
+    np.testing.assert_allclose(distance[1:], expected[1:], rtol=5.e-3)
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        along_track_distance([0., 1.], [0., 1.], method="flat")
@@ -0,0 +1,84 @@
+"""
+  cloudsat reads on a synthetic granule
+"""
+import numpy as np
+import pytest
+
+from sat_lib.cloudsat import read_cloudsat_var, read_cloudsat_vars
+
+VARNAMES = ["Radar_Reflectivity", "LayerTop", "DEM_elevation", "QR"]
+
+
+@pytest.fixture(scope="module")
+def full_ds(cloudsat_file):
+    return {varname: read_cloudsat_var(varname, cloudsat_file) for varname in VARNAMES}
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+@pytest.mark.parametrize("varname", VARNAMES)
+def test_one_profile_time_range(cloudsat_file, full_ds, varname, lazy):
+    full = full_ds[varname]
+    the_time = full.time.values[200]
+    one = read_cloudsat_var(varname, cloudsat_file, lazy=lazy,
+                            time_range=(the_time, the_time))
+    assert one.sizes["time"] == 1
+    expected = full[varname].isel(time=slice(200, 201))
+    np.testing.assert_array_equal(one[varname].values, expected.values)
+    np.testing.assert_array_equal(one.height.values, full.height.values)
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_one_profile_bbox(cloudsat_file, full_ds, lazy):
+    full = full_ds["Radar_Reflectivity"]
+    lon, lat = float(full.longitude[300]), float(full.latitude[300])
+    bbox = (lon - 1.e-3, lat - 1.e-3, lon + 1.e-3, lat + 1.e-3)
+    one = read_cloudsat_vars(VARNAMES, cloudsat_file, lazy=lazy, bbox=bbox)
+    assert one.sizes["time"] == 1
+    for varname in VARNAMES:
+        expected = full_ds[varname][varname].isel(time=slice(300, 301))
+        np.testing.assert_array_equal(one[varname].values, expected.values)
+
+
+def test_cache_defaults_and_loading(cloudsat_file, tmp_path):
+    from sat_lib.cloudsat import CloudsatCache
+    cache = CloudsatCache(tmp_path)
+    varnames = ["Radar_Reflectivity"]
+    assert (cache.cache_path(varnames, cloudsat_file) ==
+            cache.cache_path(varnames, cloudsat_file, full_heights=True, bbox=None))
+    assert (cache.cache_path(varnames, cloudsat_file) !=
+            cache.cache_path(varnames, cloudsat_file, full_heights="lazy"))
+    miss = cache.read_cloudsat_vars(varnames, cloudsat_file, full_heights="lazy")
+    hit = cache.read_cloudsat_vars(varnames, cloudsat_file, full_heights="lazy")
+    assert len(cache.entries()) == 1
+    for the_data in (miss, hit):
+        assert all(the_var.chunks is None for the_var in the_data.variables.values())
+    np.testing.assert_array_equal(miss.full_heights.values, hit.full_heights.values)
+
+
+
+
+def test_sd_closed_when_hdf_open_fails(cloudsat_file, monkeypatch):
+    import sat_lib.cloudsat as cloudsat
+    from pyhdf.error import HDF4Error
+    real_open = cloudsat.sd_open_file
+    ended = []
+
+    class RecordingSD:
+        def __init__(self, the_sd):
+            self.the_sd = the_sd
+
+        def end(self):
+            ended.append(True)
+            self.the_sd.end()
+
+    def open_sd(filename):
+        return RecordingSD(real_open(filename))
+
+    def fail(*args):
+        raise HDF4Error("HDF open failed")
+
+    monkeypatch.setattr(cloudsat, "sd_open_file", open_sd)
+    monkeypatch.setattr(cloudsat, "HDF", fail)
+    with pytest.raises(HDF4Error, match="HDF open failed"):
+        cloudsat.CloudsatFile(cloudsat_file)
+    assert len(ended) == 1
@@ -0,0 +1,21 @@
+"""
+  batch_read on copies of the synthetic granule
+"""
+import shutil
+
+from sat_lib.cloudsat_batch import batch_read
+
+
+def test_same_name_in_two_directories(cloudsat_file, tmp_path, capsys):
+    inputs = []
+    for name in ["first", "second"]:
+        the_dir = tmp_path / name
+        the_dir.mkdir()
+        inputs.append(shutil.copy(cloudsat_file, the_dir))
+    outdir = tmp_path / "out"
+    results, errors = batch_read(inputs, ["LayerTop"], outdir=outdir, nprocs=1)
+    assert errors == {}
+    out_paths = list(results.values())
+    assert len(set(out_paths)) == 2
+    assert all(out_path.is_file() for out_path in out_paths)
+    assert capsys.readouterr().out == ""
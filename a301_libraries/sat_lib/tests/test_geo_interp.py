@@ -0,0 +1,22 @@
+"""
+  5 km to 1 km geolocation on synthetic MODIS grids
+"""
+import numpy as np
+import pytest
+
+from sat_lib.geo_interp import NCOLS_1KM, interpolate_geolocation
+
+
+@pytest.mark.parametrize("ncols_5km", [271, 270])
+def test_1km_width(ncols_5km):
+    #
+    # 5 km pixel (i, j) sits at 1 km pixel (5*i + 2, 5*j + 2)
+    #
+    rows_5km = 20
+    row_5km, col_5km = np.mgrid[0:rows_5km, 0:ncols_5km]
+    lons_5km = -120. + 0.01*(5*col_5km + 2)
+    lats_5km = 50. + 0.01*(5*row_5km + 2)
+    lons_1km, lats_1km = interpolate_geolocation(lons_5km, lats_5km)
+    assert lons_1km.shape == lats_1km.shape == (5*rows_5km, NCOLS_1KM)
+    row_1km, col_1km = np.mgrid[0:5*rows_5km, 0:NCOLS_1KM]
+    np.testing.assert_allclose(lons_1km[:, 2:-6], (-120. + 0.01*col_1km)[:, 2:-6], atol=1.e-4)
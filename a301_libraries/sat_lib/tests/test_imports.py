@@ -0,0 +1,25 @@
+"""
+  the command line tools and the plain readers must not load the heavy
+  packages at import time
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+HEAVY = ["xarray", "pyproj", "pyresample"]
+
+
+@pytest.mark.parametrize("module", ["sat_lib.hdf4_inspect", "sat_lib.modismeta_read",
+                                    "sat_lib.modischan_read"])
+def test_no_heavy_imports(module):
+    code = (f"import sys, {module}; "
+            f"print(' '.join(name for name in {HEAVY!r} if name in sys.modules))")
+    #
+    # a fresh interpreter, with this process's sys.path so it finds sat_lib
+    #
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            check=True, env=env)
+    assert result.stdout.strip() == ""
@@ -0,0 +1,35 @@
+"""
+  resampling tests on a small synthetic swath
+"""
+import numpy as np
+import pytest
+
+from sat_lib.mapping import SwathResampler, laea_area_def
+
+pytest.importorskip("pyresample")
+
+FILL = -9999.
+
+
+@pytest.fixture
+def swath():
+    rows, cols = 120, 90
+    y, x = np.mgrid[0:rows, 0:cols]
+    lats = 50 + y*0.01 + x*0.001
+    lons = -123 + x*0.015 - y*0.002
+    return lons, lats
+
+
+@pytest.mark.parametrize("method", ["nearest", "bilinear", "gaussian"])
+def test_input_fill_is_left_out(swath, method):
+    lons, lats = swath
+    area_def = laea_area_def(lons, lats, 2000)
+    cube = np.stack([np.full(lons.shape, 280.), np.full(lons.shape, 300.)])
+    cube[:, 40:60, 30:50] = FILL
+    resampler = SwathResampler(lons, lats, area_def, persist=False, method=method)
+    band_ds = resampler.resample_bands(cube, input_fill=FILL)
+    for name, value in [("ch0", 280.), ("ch1", 300.)]:
+        image = band_ds[name].values
+        valid = np.isfinite(image)
+        assert valid.any()
+        np.testing.assert_allclose(image[valid], value, rtol=1.e-5)
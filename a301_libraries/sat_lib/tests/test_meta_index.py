@@ -0,0 +1,49 @@
+"""
+  bbox queries against a granule index with hand-written rows
+"""
+import json
+
+import pytest
+
+from sat_lib.meta_index import _COLUMNS, open_index, query_index
+
+
+def _row(name, min_lon, max_lon, min_lat=40., max_lat=50.):
+    row = dict.fromkeys(_COLUMNS)
+    row.update(path=f"/data/{name}.hdf", mtime=0., filename=f"{name}.hdf",
+               product="MYD021KM", daynight="Day",
+               start_time="2013-08-10T20:00:00.000000", stop_time="2013-08-10T20:05:00.000000",
+               min_lat=min_lat, max_lat=max_lat, min_lon=min_lon, max_lon=max_lon,
+               lon_list=json.dumps([min_lon, max_lon]), lat_list=json.dumps([min_lat, max_lat]))
+    return row
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    db_path = tmp_path / "index.sqlite"
+    conn = open_index(db_path)
+    rows = [_row("pacific_west", 172., 178.), _row("pacific_east", -178., -172.),
+            _row("crossing", -180., 180.), _row("bc", -130., -120.)]
+    conn.executemany(f"insert into granules ({', '.join(_COLUMNS)}) "
+                     f"values ({', '.join('?'*len(_COLUMNS))})",
+                     [[row[name] for name in _COLUMNS] for row in rows])
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def _names(rows):
+    return sorted(row["filename"][:-4] for row in rows)
+
+
+def test_bbox(db_path):
+    rows = query_index(db_path, bbox=(-135., 45., -115., 55.))
+    assert _names(rows) == ["bc", "crossing"]
+
+
+def test_bbox_across_antimeridian(db_path):
+    rows = query_index(db_path, bbox=(170., 45., -170., 55.))
+    assert _names(rows) == ["crossing", "pacific_east", "pacific_west"]
+    rows = query_index(db_path, bbox=(175., 45., -175., 55.), time_range=("2013-08-10", "2013-08-11"))
+    assert _names(rows) == ["crossing", "pacific_east", "pacific_west"]
+    assert query_index(db_path, bbox=(175., 60., -175., 70.)) == []
@@ -0,0 +1,139 @@
+"""
+  the regex ODL parser against the eval-based parser it replaced
+"""
+from pathlib import Path
+
+import pytest
+
+from sat_lib.modismeta_read import _convert_value, parseMeta, read_mda
+
+CORE_METADATA = Path(__file__).parent / "data" / "MYD021KM_CoreMetadata.0.txt"
+
+
+def eval_read_mda(attribute):
+    """
+    the original satpy-derived parser: split each line on "=" and eval
+    the value
+    """
+    lines = attribute.split("\n")
+    mda = {}
+    current_dict = mda
+    path = []
+    for line in lines:
+        if not line:
+            continue
+        if line.strip() == "END":
+            break
+        try:
+            key, val = line.split("=")
+        except ValueError:
+            continue
+        key = key.strip()
+        val = val.strip()
+        try:
+            val = eval(val)
+        except (NameError, SyntaxError, ValueError):
+            pass
+        if key in ["GROUP", "OBJECT"]:
+            new_dict = {}
+            path.append(val)
+            current_dict[val] = new_dict
+            current_dict = new_dict
+        elif key in ["END_GROUP", "END_OBJECT"]:
+            if val != path[-1]:
+                raise SyntaxError
+            path = path[:-1]
+            current_dict = mda
+            for item in path:
+                current_dict = current_dict[item]
+        elif key in ["CLASS", "NUM_VAL"]:
+            pass
+        else:
+            current_dict[key] = val
+    return mda
+
+
+@pytest.fixture(scope="module")
+def core_metadata():
+    return CORE_METADATA.read_text()
+
+
+def test_matches_eval_parser(core_metadata):
+    assert read_mda(core_metadata) == eval_read_mda(core_metadata)
+
+
+def test_parse_meta(core_metadata):
+    meta = parseMeta(core_metadata)
+    assert meta["daynight"] == "Day"
+    assert meta["orbit"] == 61764
+    assert len(meta["lon_list"]) == 4
+    assert all(isinstance(lon, float) for lon in meta["lon_list"])
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('"Day"', "Day"),
+    ('12', 12),
+    ('-7', -7),
+    ('-101.470365400394', -101.470365400394),
+    ('-1.5e3', -1500.),
+    ('1.E-05', 1.e-5),
+    ('.5', 0.5),
+    ('(1, 2)', (1, 2)),
+    ('(-128.93, -1.0e2, 3.5E+1)', (-128.93, -100., 35.)),
+    ('(1,)', (1,)),
+    ('()', ()),
+    ('("a")', "a"),
+    ('("x, y", 2)', ("x, y", 2)),
+    ('(A, B)', "(A, B)"),
+    ('Day', "Day"),
+    ('2013-08-10', "2013-08-10"),
+])
+def test_convert_value(text, expected):
+    value = _convert_value(text)
+    assert value == expected
+    assert type(value) is type(expected)
+
+
+EDGE_CASES = '''
+GROUP                  = INVENTORYMETADATA
+  GROUPTYPE            = MASTERGROUP
+  GROUP                  = OUTER
+    OBJECT                 = EQUALS
+      NUM_VAL              = 1
+      VALUE                = "a = b (c), d"
+    END_OBJECT             = EQUALS
+    OBJECT                 = NESTED
+      CLASS                = "1"
+      OBJECT                 = INNER
+        VALUE                = ("x = (1)", -2.5e-3, 7)
+      END_OBJECT             = INNER
+      GROUP                  = INNERGROUP
+        VALUE                = (1.0,
+                                2.0)
+      END_GROUP              = INNERGROUP
+    END_OBJECT             = NESTED
+    TAIL                   = 3
+  END_GROUP              = OUTER
+  AFTER                  = "done"
+END_GROUP              = INVENTORYMETADATA
+
+END
+IGNORED                = 1
+'''
+
+
+def test_edge_cases():
+    mda = read_mda(EDGE_CASES)
+    outer = mda["INVENTORYMETADATA"]["OUTER"]
+    assert outer["EQUALS"] == {"VALUE": "a = b (c), d"}
+    assert outer["NESTED"]["INNER"]["VALUE"] == ("x = (1)", -2.5e-3, 7)
+    assert outer["NESTED"]["INNERGROUP"]["VALUE"] == (1.0, 2.0)
+    assert outer["TAIL"] == 3
+    assert mda["INVENTORYMETADATA"]["AFTER"] == "done"
+    assert mda["INVENTORYMETADATA"]["GROUPTYPE"] == "MASTERGROUP"
+    assert "IGNORED" not in mda
+
+
+def test_unbalanced_group():
+    with pytest.raises(SyntaxError):
+        read_mda("GROUP = A\n  OBJECT = B\n  END_OBJECT = C\nEND_GROUP = A\n")
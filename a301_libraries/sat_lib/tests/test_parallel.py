@@ -0,0 +1,29 @@
+"""
+  map_files: ordering and error capture, in process and in a pool
+"""
+import pytest
+
+from sat_lib.parallel import map_files
+
+
+def _half(value, offset=0):
+    if value % 2:
+        raise ValueError(f"{value} is odd")
+    return value//2 + offset
+
+
+@pytest.mark.parametrize("nprocs, ordered", [(1, True), (2, True), (2, False)])
+def test_map_files(nprocs, ordered):
+    items = list(range(10))
+    results = list(map_files(_half, items, nprocs=nprocs, ordered=ordered, offset=100))
+    if ordered:
+        assert [item for item, result, error in results] == items
+    results = {item: (result, error) for item, result, error in results}
+    assert sorted(results) == items
+    for item, (result, error) in results.items():
+        if item % 2:
+            assert result is None
+            assert f"ValueError: {item} is odd" in error
+        else:
+            assert result == item//2 + 100
+            assert error is None